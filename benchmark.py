@@ -0,0 +1,615 @@
+"""
+headless benchmarks of the toll station model
+
+run with ``python benchmark.py``, every benchmark prints one line per case
+"""
+
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import tollstation as ts
+import tollstation_plaza
+import tollstation_record
+import tollstation_replay
+
+sim = ts.sim
+
+
+class CountingEnvironment(sim.Environment):
+    """
+    Environment that counts the number of executed steps
+    """
+
+    def setup(self):
+        self.events = 0
+
+    def step(self) -> None:
+        self.events += 1
+        super().step()
+
+
+def lane_events_per_second(vehicle_num: int, spacing: float = 8, till: float = 20):
+    """
+    one lane holding vehicle_num vehicles, all moving at the same speed
+
+    :return: (events, wall clock seconds)
+    """
+    road_length = ts.ROAD_LENGTH
+    env = _lane(vehicle_num, spacing)
+    start = time.perf_counter()
+    env.run(till=till)
+    duration = time.perf_counter() - start
+    ts.ROAD_LENGTH = road_length
+    return env.events, duration
+
+
+def _lane(vehicle_num: int, spacing: float) -> CountingEnvironment:
+    """
+    environment with one lane of vehicle_num vehicles driving at velocity 5,
+    ROAD_LENGTH is extended so that no vehicle leaves the road soon
+    """
+    ts.set_headless()
+    ts.ROAD_LENGTH = vehicle_num * spacing + 1000
+    env = CountingEnvironment()
+    claim_set = ts.ClaimSet(ts.ROAD_X_OFFSET)
+    # 车辆按从前到后的顺序进入车道
+    for i in reversed(range(vehicle_num)):
+        ts.Vehicle(
+            velocity=5,
+            x_pos=claim_set.x,
+            claim_set=claim_set,
+            vehicle_color=ts.VEHICLE_COLOR,
+            length_passed=i * spacing,
+        )
+    return env
+
+
+def step_allocations(
+    vehicle_num: int = 100, spacing: float = 8, warmup: float = 30, till: float = 70
+) -> tuple[float, float]:
+    """
+    steady state allocations of step mode movement, measured between warmup
+    and till, see test_allocations.py for the asserted bounds
+
+    the memory blocks are counted in a run without tracemalloc, the bytes of
+    tollstation.py in a second run traced from the start, so objects that
+    replace one another from step to step are not counted
+
+    :return: (memory blocks, bytes allocated in tollstation.py) still alive
+        per vehicle step
+    """
+    road_length = ts.ROAD_LENGTH
+    movement_mode = ts.MOVEMENT_MODE
+    ts.MOVEMENT_MODE = ts.MovementMode.STEP
+    only_model = [tracemalloc.Filter(True, ts.__file__)]
+    try:
+        env = _lane(vehicle_num, spacing)
+        env.run(till=warmup)
+        gc.collect()
+        blocks = sys.getallocatedblocks()
+        env.run(till=till)
+        gc.collect()
+        blocks = sys.getallocatedblocks() - blocks
+
+        tracemalloc.start()
+        env = _lane(vehicle_num, spacing)
+        env.run(till=warmup)
+        gc.collect()
+        before = tracemalloc.take_snapshot().filter_traces(only_model)
+        env.run(till=till)
+        gc.collect()
+        after = tracemalloc.take_snapshot().filter_traces(only_model)
+    finally:
+        tracemalloc.stop()
+        ts.ROAD_LENGTH = road_length
+        ts.MOVEMENT_MODE = movement_mode
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    steps = vehicle_num * 5 * (till - warmup) / ts.STEP_LENGTH
+    return blocks / steps, allocated / steps
+
+
+def events_per_vehicle(
+    toll_type: "ts.Gate.Type", movement_mode: "ts.MovementMode", till: float = 2000
+) -> float:
+    """
+    one lane at free flow, number of steps divided by the number of vehicles
+    that left the road
+    """
+    ts.set_headless()
+    mode = ts.MOVEMENT_MODE
+    ts.MOVEMENT_MODE = movement_mode
+    try:
+        env = CountingEnvironment()
+        claim_set = ts.ClaimSet(ts.ROAD_X_OFFSET)
+        ts.GATE_TYPE_2_SUBCLASS[toll_type](
+            toll_type=toll_type, x_pos=claim_set.x, claim_set=claim_set
+        )
+        ts.VehicleGenerator(
+            x_pos=claim_set.x, vehicle_color=ts.VEHICLE_COLOR, claim_set=claim_set
+        )
+        env.run(till=till)
+    finally:
+        ts.MOVEMENT_MODE = mode
+    # 自由流时生成器每10个时间单位生成一辆车
+    on_road = sum(c.type == ts.Claim.Type.VEHICLE for c in claim_set.claims)
+    return env.events / (till // 10 + 1 - on_road)
+
+
+def bench_lane():
+    for vehicle_num in (10, 100, 1000):
+        events, duration = lane_events_per_second(vehicle_num)
+        print(
+            f"lane with {vehicle_num:5d} vehicles: {events:8d} events "
+            f"{events / duration:10.0f} events/s"
+        )
+
+
+def bench_movement():
+    for toll_type in ts.Gate.Type:
+        for movement_mode in ts.MovementMode:
+            print(
+                f"{toll_type.name:6s} lane, {movement_mode.name:10s} movement: "
+                f"{events_per_vehicle(toll_type, movement_mode):8.1f} events/vehicle"
+            )
+
+
+def pooled_arrivals(
+    pool: bool, arrival_interval: float = 2, till: float = 5000
+) -> tuple[float, int, int]:
+    """
+    all lanes in continuous movement with a high arrival rate, where creating
+    vehicles is a large part of the work
+
+    :return: (wall clock seconds, arrivals, garbage collections)
+    """
+    ts.set_headless()
+    movement_mode = ts.MOVEMENT_MODE
+    arrival = ts.ARRIVAL_INTERVAL
+    ts.MOVEMENT_MODE = ts.MovementMode.CONTINUOUS
+    ts.POOL_VEHICLES = pool
+    ts.ARRIVAL_INTERVAL = arrival_interval
+    env = sim.Environment()
+    roads = ts.create_roads()
+    collections = sum(stats["collections"] for stats in gc.get_stats())
+    start = time.perf_counter()
+    try:
+        env.run(till=till)
+    finally:
+        ts.MOVEMENT_MODE = movement_mode
+        ts.POOL_VEHICLES = False
+        ts.ARRIVAL_INTERVAL = arrival
+    duration = time.perf_counter() - start
+    collections = sum(stats["collections"] for stats in gc.get_stats()) - collections
+    created = env._nameserializeComponent.get("vehicle.", -1) + 1
+    return duration, created, collections
+
+
+def bench_pool():
+    for pool in (False, True):
+        duration, created, collections = pooled_arrivals(pool)
+        print(
+            f"{'pooled' if pool else 'new   '} vehicles: {duration:6.2f}s "
+            f"{created:6d} arrivals {collections:5d} gc collections"
+        )
+
+
+def lane_choices(lane_num: int, choices: int = 100000) -> tuple[float, float]:
+    """
+    a plaza in steady state: every choice adds a vehicle to the least loaded
+    lane and a random lane loses one, least loaded found by the LoadIndex and
+    by a scan over all lanes
+
+    :return: microseconds per choice with the index and with the scan
+    """
+    ts.set_headless()
+    sim.Environment()
+    rng = random.Random(0)
+    lanes = [ts.ClaimSet(i) for i in range(lane_num)]
+    index = tollstation_plaza.LoadIndex()
+    loads = {}
+    for lane in lanes:
+        index.add(lane)
+        loads[lane] = 0
+    leaving = [rng.randrange(lane_num) for _ in range(choices)]
+
+    start = time.perf_counter()
+    for i in leaving:
+        lane = index.least()[1]
+        index.increment(lane)
+        lane = lanes[i]
+        if index.loads[lane]:
+            index.decrement(lane)
+    with_index = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in leaving:
+        lane = min(lanes, key=loads.__getitem__)
+        loads[lane] += 1
+        lane = lanes[i]
+        if loads[lane]:
+            loads[lane] -= 1
+    with_scan = time.perf_counter() - start
+    return with_index / choices * 1e6, with_scan / choices * 1e6
+
+
+def bench_plaza():
+    for lane_num in (8, 64, 512):
+        with_index, with_scan = lane_choices(lane_num)
+        print(
+            f"plaza with {lane_num:4d} lanes: {with_index:6.2f}us/choice indexed "
+            f"{with_scan:7.2f}us/choice scanned"
+        )
+
+
+def neighbour_queries(
+    road_num: int, window: float = 10, till: float = 300
+) -> tuple[float, float, float, float]:
+    """
+    step movement on road_num roads registered on a SpatialGrid, then the
+    claims of the adjacent lanes around every vehicle, found through the grid
+    and by scanning the claims of all lanes
+
+    :return: (seconds with grid, seconds without grid, microseconds per
+        query with grid, microseconds per query with scan)
+    """
+    ts.set_headless()
+    arrival = ts.ARRIVAL_INTERVAL
+    ts.ARRIVAL_INTERVAL = 3
+    try:
+        durations = []
+        for grid in (ts.SpatialGrid(), None):
+            env = sim.Environment()
+            roads = ts.create_roads(road_num, seed=0, grid=grid)
+            start = time.perf_counter()
+            env.run(till=till)
+            durations.append(time.perf_counter() - start)
+            if grid is not None:
+                grid_roads = roads
+    finally:
+        ts.ARRIVAL_INTERVAL = arrival
+    claims = [claim for road in grid_roads for claim in road.claim_set.claims]
+    vehicles = [claim for claim in claims if claim.type is ts.Claim.Type.VEHICLE]
+
+    start = time.perf_counter()
+    for vehicle in vehicles:
+        list(vehicle.neighbours(window))
+    with_grid = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for vehicle in vehicles:
+        x = vehicle.claim_set.x
+        [
+            claim
+            for claim in claims
+            if claim.claim_set is not vehicle.claim_set
+            and abs(claim.claim_set.x - x) <= ts.ROAD_INTERVAL
+            and claim.yl < vehicle.yu + window
+            and claim.yu > vehicle.yl - window
+        ]
+    with_scan = time.perf_counter() - start
+    n = len(vehicles)
+    return durations[0], durations[1], with_grid / n * 1e6, with_scan / n * 1e6
+
+
+def bench_grid():
+    for road_num in (8, 64):
+        with_grid, without_grid, query, scan = neighbour_queries(road_num)
+        print(
+            f"grid with {road_num:3d} roads: run {with_grid:6.2f}s "
+            f"(without grid {without_grid:6.2f}s), neighbours {query:7.1f}us/query "
+            f"(scan {scan:8.1f}us/query)"
+        )
+
+
+def recording_overhead(
+    movement_mode: "ts.MovementMode", path: str, till: float = 2000
+) -> tuple[float, float, int]:
+    """
+    congested roads (gates moving for 7 time units) run without and with a
+    TrajectoryRecorder
+
+    :return: (seconds without, seconds with recorder, rows recorded)
+    """
+    ts.set_headless()
+    saved = ts.MOVEMENT_MODE, ts.Gate._MOVE_TIME
+    ts.MOVEMENT_MODE = movement_mode
+    ts.Gate._MOVE_TIME = 7
+    durations = []
+    try:
+        for recorder in (None, tollstation_record.TrajectoryRecorder(path)):
+            env = sim.Environment()
+            ts.create_roads(seed=0)
+            ts.RECORDER = recorder
+            start = time.perf_counter()
+            env.run(till=till)
+            if recorder is not None:
+                recorder.close()
+            durations.append(time.perf_counter() - start)
+    finally:
+        ts.RECORDER = None
+        ts.MOVEMENT_MODE, ts.Gate._MOVE_TIME = saved
+    return durations[0], durations[1], recorder.rows
+
+
+def recorder_rows_per_second(path: str, rows: int = 2_000_000) -> float:
+    """
+    rows per second through TrajectoryRecorder.record() including the writes
+    """
+    start = time.perf_counter()
+    with tollstation_record.TrajectoryRecorder(path) as recorder:
+        for i in range(rows):
+            recorder.record(i * 0.1, i, 10.0, 1.0, 5.0, 0.0)
+    return rows / (time.perf_counter() - start)
+
+
+def bench_recorder():
+    with tempfile.TemporaryDirectory() as directory:
+        for movement_mode in ts.MovementMode:
+            without, with_recorder, rows = recording_overhead(
+                movement_mode, os.path.join(directory, movement_mode.name)
+            )
+            print(
+                f"recording {movement_mode.name:10s} movement: {rows:7d} rows "
+                f"{(with_recorder / without - 1) * 100:5.1f}% overhead"
+            )
+        rate = recorder_rows_per_second(os.path.join(directory, "rows"))
+        print(f"recorder: {rate:10.0f} rows/s")
+
+
+def replay_queries(
+    path: str, till: float, queries: int = 10000
+) -> tuple[int, float, float]:
+    """
+    adaptive movement on congested roads recorded till till, then the states
+    at random times of the replay
+
+    :return: (rows recorded, seconds to index, microseconds per state query)
+    """
+    ts.set_headless()
+    saved = ts.MOVEMENT_MODE, ts.Gate._MOVE_TIME
+    ts.MOVEMENT_MODE = ts.MovementMode.ADAPTIVE
+    ts.Gate._MOVE_TIME = 7
+    try:
+        env = sim.Environment()
+        ts.create_roads(seed=0)
+        with tollstation_record.TrajectoryRecorder(path) as ts.RECORDER:
+            env.run(till=till)
+    finally:
+        ts.RECORDER = None
+        ts.MOVEMENT_MODE, ts.Gate._MOVE_TIME = saved
+    rows = tollstation_record.load_trajectories(path)
+    start = time.perf_counter()
+    replay = tollstation_replay.Replay(rows)
+    indexed = time.perf_counter() - start
+    times = random.Random(0).choices(range(int(till)), k=queries)
+    start = time.perf_counter()
+    for t in times:
+        replay.state(t)
+    return len(rows), indexed, (time.perf_counter() - start) / queries * 1e6
+
+
+def bench_replay():
+    with tempfile.TemporaryDirectory() as directory:
+        for till in (1000, 10000):
+            rows, indexed, query = replay_queries(
+                os.path.join(directory, str(till)), till
+            )
+            print(
+                f"replay of {till:5d} time units: {rows:7d} rows indexed in "
+                f"{indexed:5.2f}s, {query:6.1f}us/state"
+            )
+
+
+def accounting_overhead(till: float = 300, repeat: int = 3) -> tuple[float, float]:
+    """
+    default roads without and with component accounting, best of repeat runs
+
+    :return: (seconds without, seconds with accounting)
+    """
+    ts.set_headless()
+    durations = {False: [], True: []}
+    for _ in range(repeat):
+        for accounting in (False, True):
+            env = sim.Environment()
+            ts.create_roads(seed=0)
+            env.accounting(accounting)
+            start = time.perf_counter()
+            env.run(till=till)
+            durations[accounting].append(time.perf_counter() - start)
+    return min(durations[False]), min(durations[True])
+
+
+def bench_accounting():
+    without, with_accounting = accounting_overhead()
+    print(
+        f"accounting: {without:6.2f}s without, {with_accounting:6.2f}s with "
+        f"({(with_accounting / without - 1) * 100:4.1f}% overhead)"
+    )
+
+
+class _Sleeper(sim.Component):
+    def process(self):
+        pass
+
+
+def rescheduling(pending: int, operations: int = 1000) -> tuple[float, float]:
+    """
+    pending components scheduled at random times, then operations random
+    reschedules (activate at another time) and cancels of scheduled components
+
+    :return: (microseconds per reschedule, microseconds per cancel)
+    """
+    ts.set_headless()
+    env = sim.Environment()
+    stream = random.Random(0)
+    components = [_Sleeper(at=stream.uniform(1, 1000)) for _ in range(pending)]
+    chosen = stream.sample(components, operations)
+    start = time.perf_counter()
+    for component in chosen:
+        component.activate(at=stream.uniform(1, 1000))
+    rescheduled = time.perf_counter() - start
+    start = time.perf_counter()
+    for component in chosen:
+        component.cancel()
+    cancelled = time.perf_counter() - start
+    env.run()
+    return rescheduled / operations * 1e6, cancelled / operations * 1e6
+
+
+def bench_event_list():
+    for pending in (1000, 100_000):
+        reschedule, cancel = rescheduling(pending)
+        print(
+            f"event list with {pending:6d} pending: {reschedule:8.2f}us/reschedule "
+            f"{cancel:8.2f}us/cancel"
+        )
+
+
+class _StandbyVehicle(sim.Component):
+    """
+    vehicle polling with standby till the gate serves its ticket, like the
+    blocking of the toll model before claim waiters, then it queues again.
+    With gate.watched it waits with standby_on(gate) instead
+    """
+
+    def setup(self, gate: "_StandbyGate", ticket: int):
+        self.gate = gate
+        self.ticket = ticket
+
+    def process(self):
+        while True:
+            while self.gate.served < self.ticket:
+                if self.gate.watched:
+                    self.standby_on(self.gate)
+                else:
+                    self.standby()
+            self.ticket += len(self.gate.vehicles)
+
+
+class _StandbyGate(sim.Component):
+    """
+    serves one ticket per time unit, so all but one of the vehicles are in
+    standby all the time, and activates interruptions vehicles in standby
+    every time unit
+    """
+
+    def setup(self, vehicle_num: int, interruptions: int = 1, watched: bool = False):
+        self.served = 0
+        self.interruptions = interruptions
+        self.watched = watched
+        self.vehicles = [
+            _StandbyVehicle(gate=self, ticket=i + 1) for i in range(vehicle_num)
+        ]
+
+    def process(self):
+        while True:
+            self.hold(1)
+            self.served += 1
+            if self.watched:
+                sim.signal_change(self)
+            # 打断 standby 的车辆,走 Component._remove
+            for i in range(self.interruptions):
+                self.vehicles[(self.served * 7 + i) % len(self.vehicles)].activate()
+
+
+def standby_events_per_second(
+    vehicle_num: int, till: float = 10, interruptions: int = 1
+) -> float:
+    ts.set_headless()
+    env = CountingEnvironment()
+    _StandbyGate(vehicle_num=vehicle_num, interruptions=interruptions)
+    start = time.perf_counter()
+    env.run(till=till)
+    return env.events / (time.perf_counter() - start)
+
+
+def standby_interruptions(standby_num: int, operations: int = 1000) -> float:
+    """
+    standby_num components in standby, then operations activates of randomly
+    chosen ones, each taking the component out of the standby lists
+
+    :return: microseconds per activate
+    """
+    ts.set_headless()
+    env = sim.Environment()
+    stream = random.Random(0)
+    components = [_Sleeper() for _ in range(standby_num)]
+    for component in components:
+        component.standby()
+    chosen = stream.sample(components, min(operations, standby_num // 2))
+    start = time.perf_counter()
+    for component in chosen:
+        component.activate()
+    interrupted = time.perf_counter() - start
+    env.run(till=1)
+    return interrupted / len(chosen) * 1e6
+
+
+def bench_standby():
+    for vehicle_num in (500, 2000):
+        rate = standby_events_per_second(vehicle_num)
+        print(f"standby with {vehicle_num:4d} waiting vehicles: {rate:9.0f} events/s")
+    for standby_num in (500, 50_000):
+        interrupt = standby_interruptions(standby_num)
+        print(
+            f"standby with {standby_num:5d} waiting components: "
+            f"{interrupt:6.2f}us/interruption"
+        )
+
+
+def standby_on_run(vehicle_num: int, watched: bool, till: float = 10) -> tuple:
+    """
+    the gate model of standby_events_per_second with the vehicles waiting with
+    standby or with standby_on the gate
+
+    :return: seconds for the run, events and standby runs avoided
+    """
+    ts.set_headless()
+    env = CountingEnvironment()
+    _StandbyGate(vehicle_num=vehicle_num, interruptions=0, watched=watched)
+    start = time.perf_counter()
+    env.run(till=till)
+    return (
+        time.perf_counter() - start,
+        env.events,
+        env.standby_on_statistics()["avoided"],
+    )
+
+
+def bench_standby_on():
+    for vehicle_num in (500, 2000):
+        for watched in (False, True):
+            duration, events, avoided = standby_on_run(vehicle_num, watched)
+            print(
+                f"{'standby_on' if watched else 'standby':10s} with {vehicle_num:4d} "
+                f"waiting vehicles: {duration:7.3f}s, {events:8d} events, "
+                f"{avoided:8d} runs avoided"
+            )
+
+
+def bench_allocations():
+    blocks, allocated = step_allocations()
+    print(
+        f"step movement: {blocks:.4f} memory blocks, "
+        f"{allocated:.3f} bytes retained per vehicle step"
+    )
+
+
+if __name__ == "__main__":
+    bench_lane()
+    bench_movement()
+    bench_allocations()
+    bench_pool()
+    bench_plaza()
+    bench_grid()
+    bench_recorder()
+    bench_replay()
+    bench_accounting()
+    bench_event_list()
+    bench_standby()
+    bench_standby_on()
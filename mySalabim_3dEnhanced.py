@@ -61,8 +61,7 @@ from typing import (
     Optional,
 )
 # added
-from pympler import tracker
-from pympler import summary
+# pympler is imported when the first memory summary is printed, see SUMMARY_INTERVAL
 # added
 
 # module = salabim  # for PythonInExcel runner
@@ -82,7 +81,13 @@ AnacondaCode = sys.platform == "emscripten"
 # added
 Enable_frustum_culling = False
 Projection_dot_view_matrix = None
-tr = tracker.SummaryTracker()
+# level of detail of Animate3dBox: beyond Lod_quad_distance from the eye a box
+# is drawn as its top quad, beyond Lod_point_distance as a single point
+Enable_level_of_detail = False
+Lod_quad_distance = 150
+Lod_point_distance = 400
+Eye_position = None
+tr = None
 SUMMARY_INTERVAL = 100
 SUMMARY_CNT = 0
 # added
@@ -1374,6 +1379,8 @@ class Monitor:
         """
         if self.isgenerated:
             raise TypeError("sliced, merged or frozen monitors cannot be reset")
+        if self.env._standby_watchers:  # added
+            signal_change(self, self.env)
 
         if self._stats_only:
             if self._level:
@@ -4584,6 +4591,8 @@ class Qmember:
                 q.env.print_trace("", "", c.name(), "enter " + q.name())
         q.length.tally(q._length)
         q.number_of_arrivals += 1
+        if q.env._standby_watchers:  # added
+            signal_change(q, q.env)
         if isinstance(q, Store):
             store = q
             for requester in store._from_store_requesters:
@@ -7625,6 +7634,11 @@ class Component:
         self._from_stores = []
         self._to_stores = []
         self._on_event_list = False
+        self._event_entry = None  # added, see Environment._purge_event_list
+        self._standby_entry = None  # added, see Component.standby
+        self._standby_watched = None  # added, see Component.standby_on
+        self._standby_on_events = 0
+        self._standby_on_woken = False
         self._scheduled_time = inf
         self._failed = False
         self._skip_standby = skip_standby
@@ -7984,26 +7998,30 @@ by adding at the end:
             else:
                 seq = self.env._seq
             self._on_event_list = True
-            heapq.heappush(self.env._event_list, (t, priority, seq, self, return_value))
+            self._event_entry = entry = (t, priority, seq, self, return_value)
+            heapq.heappush(self.env._event_list, entry)
         if self.env._yieldless:
             if self is self.env._current_component:
                 self.env._glet.switch()
 
     def _remove(self):
         if self._on_event_list:
-            for i in range(len(self.env._event_list)):
-                if self.env._event_list[i][3] == self:
-                    self.env._event_list[i] = self.env._event_list[0]
-                    self.env._event_list.pop(0)
-                    heapq.heapify(self.env._event_list)
-                    self._on_event_list = False
-                    return
-            raise Exception("remove error", self.name())
+            # added
+            # lazy deletion: the entry stays in the heap as a tombstone, it is
+            # skipped when it reaches the top and the heap is compacted once
+            # half of it are tombstones, so cancelling is O(log n) amortized
+            self._event_entry = None
+            self._on_event_list = False
+            env = self.env
+            env._cancelled_events += 1
+            if env._cancelled_events * 2 > len(env._event_list):
+                env._compact_event_list()
+            return
+            # added
         if self.status.value == standby:
-            if self in self.env._standbylist:
-                self.env._standbylist.remove(self)
-            if self in self.env._pendingstandbylist:
-                self.env._pendingstandbylist.remove(self)
+            self._standby_entry = None  # added, the entry in the standby lists is skipped
+        elif self._standby_watched is not None and self.status.value == passive:
+            self._unwatch()  # added, activated otherwise during standby_on
 
     def _check_fail(self):
         if self._requests:
@@ -8062,6 +8080,7 @@ by adding at the end:
                     f"scheduled time ({scheduled_time:0.3f}) before now ({self.env._now:0.3f})"
                 )
         self._scheduled_time = scheduled_time
+        self._schedule_reason = caller  # added, see ComponentAccounting
         if self.env._trace:
             if extra == "*":
                 scheduled_time_str = "ends on no events left  "
@@ -8670,7 +8689,12 @@ by adding:
         self._scheduled_time = self.env._now
         self.set_mode(mode)
         caller = "standby"
-        self.env._standbylist.append(self)
+        # added
+        # the standby lists hold entries (component,), an entry is cancelled by
+        # dropping it as _standby_entry, so nothing has to be searched
+        self._standby_entry = entry = (self,)
+        self.env._standbylist.append(entry)
+        # added
         self.status._value = standby
 
         if self.env._trace:
@@ -8686,6 +8710,78 @@ by adding:
             if self is self.env._current_component:
                 self.env._glet.switch()
 
+    # added
+    def standby_on(self, *watched: Any, mode: str = None) -> None:
+        """
+        puts the component in standby till one of the watched objects changes
+
+        Parameters
+        ----------
+        watched : Queue, State, Monitor or any object
+            objects to watch, the component is activated when the first of
+            them changes. A queue changes when a component enters or leaves,
+            a state when it is set or triggered, a monitor when it is tallied.
+            For any other object, like a user defined dirty flag, the model
+            calls signal_change(object) when it changes
+
+        mode : str preferred
+            mode
+
+            will be used in trace and can be used in animations
+
+            if nothing specified, the mode will be unchanged.
+
+        Note
+        ----
+        Meant to replace standby in a loop that checks a condition, like ::
+
+            while len(q) == 0:
+                self.standby_on(q)
+
+        standby runs the component again after every event, standby_on keeps
+        it passive till a watched object changes. The number of runs avoided
+        that way is shown in the trace and in
+        Environment.standby_on_statistics().
+
+        If the component is activated otherwise, it stops watching.
+
+        Only if yieldless is False: use ``yield self.standby_on(...)``.
+        """
+        if not watched:
+            raise ValueError("standby_on requires at least one object to watch")
+        if self.status.value != current:
+            self.passivate(mode)  # returns at once, as self is not current
+            self._watch(watched)
+        else:
+            self._watch(watched)
+            self.passivate(mode)
+
+    def _watch(self, watched: Tuple) -> None:
+        # the watchers of an object are kept by the environment, keyed on the
+        # id of the object, so any object can be watched. The object stays
+        # alive while it is in _standby_watched, so its id can't be reused
+        standby_watchers = self.env._standby_watchers
+        for obj in watched:
+            watchers = standby_watchers.get(id(obj))
+            if watchers is None:
+                standby_watchers[id(obj)] = watchers = {}
+            watchers[self] = None
+        self._standby_watched = watched
+        self._standby_on_events = self.env._event_count
+        self._standby_on_woken = False
+
+    def _unwatch(self, changed: Any = None) -> None:
+        standby_watchers = self.env._standby_watchers
+        for obj in self._standby_watched:
+            if obj is not changed:
+                watchers = standby_watchers.get(id(obj))
+                if watchers is not None:
+                    watchers.pop(self, None)
+                    if not watchers:
+                        del standby_watchers[id(obj)]
+        self._standby_watched = None
+
+    # added
     def from_store(
         self,
         store: Union["Store", Iterable],
@@ -10328,6 +10424,8 @@ by adding:
         q.length.tally(q._length)
         q.available_quantity.tally(q.capacity._tally - q._length)
         q.number_of_departures += 1
+        if q.env._standby_watchers:  # added
+            signal_change(q, q.env)
 
         if isinstance(q, Store):
             store = q
@@ -10457,6 +10555,37 @@ by adding:
         """
         return self._creation_time - self.env._offset
 
+    # added
+    def renew(self) -> None:
+        """
+        makes an ended component look like a newly created one, so it can be
+        reused instead of creating another component of the same class
+
+        the component gets the next name and sequence number of its base name
+        (if it was serialized), the creation time is set to now and the status
+        and mode monitors are reset and renamed
+
+        Note
+        ----
+        Only for data components, e.g. after the process ended.
+        Attributes of subclasses are not touched, reinitialize them before
+        activating the component again.
+        """
+        if self.status.value != data:
+            raise ValueError(
+                f"{self.name()} is not a data component, can't be renewed"
+            )
+        base_name = getattr(self, "_base_name", None)
+        if base_name is not None:
+            _set_name(base_name, self.env._nameserializeComponent, self)
+        self._creation_time = self.env._now
+        self._failed = False
+        self.status.name(self.name() + ".status")
+        self.status.reset()
+        self.mode.name(self.name() + ".mode")
+        self.mode.reset()
+
+    # added
     def scheduled_time(self) -> float:
         """
         Returns
@@ -10472,14 +10601,9 @@ by adding:
         -------
         priority the component is scheduled with : float
             returns None otherwise
-
-        Note
-        ----
-        The method has to traverse the event list, so performance may be an issue.
         """
-        for t, priority, seq, component, return_value in self.env._event_list:
-            if component is self:
-                return priority
+        if self._event_entry is not None:  # added
+            return self._event_entry[1]
         return None
 
     def remaining_duration(
@@ -11105,6 +11229,8 @@ class Environment:
         _set_name(name, Environment._nameserialize, self)
 
         self._nameserializeMonitor = {}  # required here for to_freeze functionality
+        # added, see Component.standby_on, before any monitor is tallied
+        self._standby_watchers = {}
         self._time_unit = _time_unit_lookup(time_unit)
         self._time_unit_name = time_unit
         if yieldless is None:
@@ -11157,8 +11283,13 @@ class Environment:
         self._nameserializeState = {}
         self._seq = 0
         self._event_list = []
-        self._standbylist = []
-        self._pendingstandbylist = []
+        self._standbylist = collections.deque()  # added: deques of (component,)
+        self._pendingstandbylist = collections.deque()
+        self._accounting = None  # added
+        self._cancelled_events = 0  # added, see _purge_event_list
+        self._event_count = 0  # added, see Component.standby_on
+        self._standby_on_wakeups = 0
+        self._standby_on_avoided = 0
 
         self.an_objects = set()
         self.an_objects_over3d = set()
@@ -11803,9 +11934,14 @@ class Environment:
 
         try:
             if not self._current_component._skip_standby:
-                if len(self.env._pendingstandbylist) > 0:
-                    c = self.env._pendingstandbylist.pop(0)
-                    if c.status.value == standby:  # skip cancelled components
+                pendingstandbylist = self.env._pendingstandbylist
+                while pendingstandbylist:  # added: loop, deque and entries
+                    entry = pendingstandbylist.popleft()
+                    c = entry[0]
+                    if (
+                        c._standby_entry is entry and c.status.value == standby
+                    ):  # skip cancelled components
+                        c._standby_entry = None
                         c.status._value = current
                         c._scheduled_time = inf
                         self.env._current_component = c
@@ -11817,6 +11953,8 @@ class Environment:
                                 s0=c.lineno_txt(),
                                 _optional=self._suppress_trace_standby,
                             )
+                        if self._accounting is not None:  # added
+                            self._accounting.start(c, "standby")
                         if self.env._yieldless:
                             c._glet.switch()
                             if c._glet.dead:
@@ -11834,12 +11972,26 @@ class Environment:
                                 self._terminate(c)
                                 return
 
-            if len(self.env._standbylist) > 0:
-                self._pendingstandbylist = list(self.env._standbylist)
-                self.env._standbylist = []
+            if self.env._standbylist:
+                # added: swap the deques instead of copying
+                pendingstandbylist = self._pendingstandbylist
+                pendingstandbylist.clear()
+                self._pendingstandbylist = self.env._standbylist
+                self.env._standbylist = pendingstandbylist
 
+            if self._cancelled_events:  # added
+                self._purge_event_list()
             if self._event_list:
                 (t, priority, seq, c, return_value) = heapq.heappop(self._event_list)
+                c._event_entry = None  # added
+                # added
+                # events for Component.standby_on, runs after a standby_on
+                # wakeup are not counted, plain standby has no events for them
+                if c._standby_on_woken:
+                    c._standby_on_woken = False
+                else:
+                    self._event_count += 1
+                # added
             else:
                 c = self._main
                 if self.end_on_empty_eventlist:
@@ -11854,6 +12006,10 @@ class Environment:
             global SUMMARY_INTERVAL
             global tr
             if SUMMARY_CNT * SUMMARY_INTERVAL < t:
+                from pympler import summary, tracker
+
+                if tr is None:
+                    tr = tracker.SummaryTracker()
                 SUMMARY_CNT += 1
                 s = tr.create_summary()
                 summary.print_(s)
@@ -11883,6 +12039,8 @@ class Environment:
             if c == self._main:
                 self.running = False
                 return
+            if self._accounting is not None:  # added
+                self._accounting.start(c, c._schedule_reason)
             c._check_fail()
             if self.env._yieldless:
                 if PyPy:
@@ -11916,6 +12074,9 @@ class Environment:
             if self._animate:
                 self.an_quit()
             raise e
+        finally:
+            if self._accounting is not None:  # added
+                self._accounting.stop()
 
     def _terminate(self, c):
         if self.env._yieldless:
@@ -11965,8 +12126,31 @@ class Environment:
         c._scheduled_time = inf
         c._process = None
 
+    # added
+    def _purge_event_list(self) -> None:
+        """
+        pops the tombstones of cancelled events from the top of the event list
+        """
+        event_list = self._event_list
+        while event_list and event_list[0][3]._event_entry is not event_list[0]:
+            heapq.heappop(event_list)
+            self._cancelled_events -= 1
+
+    def _compact_event_list(self) -> None:
+        """
+        removes all tombstones of cancelled events from the event list
+        """
+        self._event_list = [
+            entry for entry in self._event_list if entry[3]._event_entry is entry
+        ]
+        heapq.heapify(self._event_list)
+        self._cancelled_events = 0
+
+    # added
+
     def _print_event_list(self, s: str = "") -> None:
         print("eventlist ", s)
+        self._compact_event_list()  # added
         for t, priority, sequence, comp, return_value in self._event_list:
             print(
                 "    ",
@@ -13798,9 +13982,16 @@ class Environment:
 
         Only for advance use with animation / GUI event loops
         """
-        if len(self.env._pendingstandbylist) > 0:
+        pendingstandbylist = self.env._pendingstandbylist
+        while pendingstandbylist and (  # added: skip cancelled entries
+            pendingstandbylist[0][0]._standby_entry is not pendingstandbylist[0]
+        ):
+            pendingstandbylist.popleft()
+        if pendingstandbylist:
             return self.env._now
         else:
+            if self._cancelled_events:  # added
+                self._purge_event_list()
             if self._event_list:
                 return self._event_list[0][0]
             else:
@@ -13946,6 +14137,57 @@ class Environment:
             self._suppress_trace_linenumbers = value
         return self._suppress_trace_linenumbers
 
+    def accounting(
+        self, value: bool = None, report_at_end: bool = None
+    ) -> Optional["ComponentAccounting"]:
+        """
+        per component class accounting of activations and process time
+
+        Parameters
+        ----------
+        value : bool
+            if True, start accounting with empty counters (also if already on)
+
+            if False, stop accounting
+
+            if omitted, no change
+
+        report_at_end : bool
+            if True, the report is printed at the end of every run
+
+            if omitted, no change
+
+        Returns
+        -------
+        the ComponentAccounting, or None if accounting is off
+
+        Note
+        ----
+        the accounting is kept in Environment.step, so it costs two
+        time.perf_counter() calls and a few dict updates per event, which is
+        low enough to leave it on in production runs
+        """
+        if value is not None:
+            self._accounting = ComponentAccounting() if value else None
+        if report_at_end is not None and self._accounting is not None:
+            self._accounting.report_at_end = report_at_end
+        return self._accounting
+
+    # added
+    def standby_on_statistics(self) -> Dict[str, int]:
+        """
+        Returns
+        -------
+        statistics of standby_on : dict
+            wakeups : number of times a component was activated by a change
+            of an object it watched
+
+            avoided : number of runs plain standby would have made in vain,
+            one for every event while a component was watching
+        """
+        return dict(wakeups=self._standby_on_wakeups, avoided=self._standby_on_avoided)
+
+    # added
     def suppress_trace_standby(self, value: bool = None) -> bool:
         """
         suppress_trace_standby status
@@ -14123,6 +14365,8 @@ class Environment:
                 self.do_simulate_and_animate()
             else:
                 self.do_simulate()
+        if self._accounting is not None and self._accounting.report_at_end:  # added
+            self._accounting.print_report()
         if self.stopped:
             self.quit()
             if self._video:
@@ -22152,6 +22396,7 @@ class _BlindVideoMaker(Component):
     def process_yielded(self):
         while True:
             self.handle()
+            self.env._purge_event_list()  # added
             if not self.env._event_list:
                 break  # we've finished
             yield self.hold(self.env._speed / self.env._fps)
@@ -22159,6 +22404,7 @@ class _BlindVideoMaker(Component):
     def process_yieldless(self):
         while True:
             self.handle()
+            self.env._purge_event_list()  # added
             if not self.env._event_list:
                 break  # we've finished
             self.hold(self.env._speed / self.env._fps)
@@ -25121,6 +25367,8 @@ class State:
         self._trywait()
 
     def _trywait(self, max=inf):
+        if self.env._standby_watchers:  # added
+            signal_change(self, self.env)
         mx = self._waiters._head.successor
         while mx != self._waiters._tail:
             c = mx.component
@@ -27062,6 +27310,8 @@ class _AnimateIntro(Animate3dBase):
         glu.gluLookAt(
             x_eye, y_eye, z_eye, x_center, y_center, z_center, x_up, y_up, z_up
         )
+        global Eye_position
+        Eye_position = (x_eye, y_eye, z_eye)
 
         gl.glEnable(gl.GL_LIGHTING)
         gl.glLightModelfv(self.model_lights_pname(t), self.model_lights_param(t))
@@ -27922,6 +28172,28 @@ class Animate3dBox(Animate3dBase):
         z_c = (z + z_ref / 2 * z_len) + 0
 
         if self.is_point_in_frustum(t):
+            if Enable_level_of_detail and Eye_position is not None:
+                # the center of the box as drawn, offsets included
+                x_c += self.x_offset
+                y_c += self.y_offset
+                z_c += self.z_offset
+                distance = math.dist(Eye_position, (x_c, y_c, z_c))
+                if distance > Lod_point_distance:
+                    if show:
+                        draw_point3d(x=x_c, y=y_c, z=z_c, gl_color=gl_color)
+                    return
+                if distance > Lod_quad_distance:
+                    if show:
+                        draw_quad3d(
+                            x_len=x_len,
+                            y_len=y_len,
+                            x=x_c,
+                            y=y_c,
+                            z=z_c + z_len / 2,
+                            z_angle=self.z_angle(t),
+                            gl_color=gl_color,
+                        )
+                    return
             draw_box3d(
                 x_len=self.x_len(t),
                 y_len=self.y_len(t),
@@ -28626,6 +28898,39 @@ def draw_rectangle3d(x0=0, y0=0, z=0, x1=1, y1=1, gl_color=(1, 1, 1)):
     gl.glEnd()
 
 
+def draw_point3d(x=0, y=0, z=0, gl_color=(1, 1, 1)):
+    """
+    draws a single point, the far level of detail of a box
+    """
+    gl.glMaterialfv(gl.GL_FRONT, gl.GL_AMBIENT_AND_DIFFUSE, gl_color)
+    gl.glBegin(gl.GL_POINTS)
+    gl.glNormal3f(0, 0, 1)
+    gl.glVertex3f(x, y, z)
+    gl.glEnd()
+
+
+def draw_quad3d(x_len=1, y_len=1, x=0, y=0, z=0, z_angle=0, gl_color=(1, 1, 1)):
+    """
+    draws a horizontal x_len by y_len quad centered on x, y at height z, the
+    middle level of detail of a box (its top face)
+    """
+    x1 = x_len / 2
+    y1 = y_len / 2
+    gl.glPushMatrix()
+    gl.glTranslate(x, y, z)
+    if z_angle:
+        gl.glRotate(z_angle, 0.0, 0.0, 1.0)
+    gl.glMaterialfv(gl.GL_FRONT, gl.GL_AMBIENT_AND_DIFFUSE, gl_color)
+    gl.glBegin(gl.GL_QUADS)
+    gl.glNormal3f(0, 0, 1)
+    gl.glVertex3f(-x1, -y1, 0)
+    gl.glVertex3f(x1, -y1, 0)
+    gl.glVertex3f(x1, y1, 0)
+    gl.glVertex3f(-x1, y1, 0)
+    gl.glEnd()
+    gl.glPopMatrix()
+
+
 def draw_box3d(
     x_len=1,
     y_len=1,
@@ -29741,6 +30046,134 @@ def set_projection_dot_view_matrix():
     ).T
 
 
+class ComponentAccounting:
+    """
+    activations per component class and scheduling reason, and the wall clock
+    time spent in the process of each class, kept by Environment.step
+
+    the reason is the first word of the call that scheduled the component,
+    like hold, activate, request or wait, or standby for components taken from
+    the standby list
+
+    use Environment.accounting() to switch on
+    """
+
+    def __init__(self):
+        self.activations = collections.defaultdict(int)  # (class, reason) -> count
+        self.process_time = collections.defaultdict(float)  # class -> seconds
+        self.report_at_end = False
+        self._class = None
+        self._reason = None
+        self._start = 0.0
+
+    def start(self, component: "Component", reason: str) -> None:
+        self._class = type(component)
+        self._reason = reason
+        self._start = time.perf_counter()
+
+    def stop(self) -> None:
+        if self._class is None:
+            return
+        self.process_time[self._class] += time.perf_counter() - self._start
+        # reasons are reduced to their first word only in summary()
+        self.activations[self._class, self._reason] += 1
+        self._class = None
+
+    def reset(self) -> None:
+        self.activations.clear()
+        self.process_time.clear()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        per class name: activations per reason, total activations and process
+        time in seconds, ordered on descending process time
+        """
+        reasons = collections.defaultdict(dict)
+        for (cls, reason), n in sorted(
+            self.activations.items(), key=lambda item: item[0][1]
+        ):
+            reason = reason.partition(" ")[0]
+            reasons[cls][reason] = reasons[cls].get(reason, 0) + n
+        result = {}
+        for cls in sorted(self.process_time, key=self.process_time.get, reverse=True):
+            result[cls.__name__] = dict(
+                reasons=reasons[cls],
+                activations=sum(reasons[cls].values()),
+                process_time=self.process_time[cls],
+            )
+        return result
+
+    def print_report(self, as_str: bool = False, file: TextIO = None) -> str:
+        """
+        prints the summary as a table
+
+        Parameters
+        ----------
+        as_str: bool
+            if False (default), print the report
+            if True, return a string containing the report
+
+        file: file
+            if None(default), print to stdout
+            otherwise, print to file
+        """
+        summary = self.summary()
+        total = sum(self.process_time.values())
+        result = [
+            f"{'component class':<24} {'activations':>11} {'time (s)':>9} "
+            f"{'us/act':>8} {'share':>6}  reasons"
+        ]
+        for name, row in summary.items():
+            activations = row["activations"]
+            process_time = row["process_time"]
+            result.append(
+                f"{name:<24} {activations:11d} {process_time:9.3f} "
+                f"{process_time / activations * 1e6 if activations else 0:8.2f} "
+                f"{process_time / total * 100 if total else 0:5.1f}%  "
+                + " ".join(f"{reason}={n}" for reason, n in row["reasons"].items())
+            )
+        return return_or_print(result, as_str, file)
+
+
+# added
+def signal_change(obj: Any, env: "Environment" = None) -> None:
+    """
+    activates the components that wait for obj with standby_on
+
+    Queue, State and Monitor signal their changes themselves, for any other
+    watched object call this when it changes
+
+    Parameters
+    ----------
+    obj : any
+        the changed object
+
+    env : Environment
+        environment of the watching components
+
+        if omitted, default_env is used
+    """
+    watchers = _set_env(env)._standby_watchers.pop(id(obj), None)
+    if not watchers:
+        return
+    for c in watchers:
+        watched = c._standby_watched
+        if watched is None or c.status.value != passive:
+            continue  # activated otherwise in the meantime
+        c._unwatch(changed=obj)
+        env = c.env
+        avoided = max(env._event_count - c._standby_on_events - 1, 0)
+        env._standby_on_wakeups += 1
+        env._standby_on_avoided += avoided
+        if env._trace:
+            env.print_trace(
+                "", "", c.name() + " standby_on", f"{avoided} standby runs avoided"
+            )
+        c.activate()
+        c._standby_on_woken = True
+
+
+# added
 class capture_stdout:
     """
     specifies how to capture stdout
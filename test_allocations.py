@@ -0,0 +1,123 @@
+"""
+steady state allocations of step mode movement
+
+run with ``python -m pytest test_allocations.py``. A lane of vehicles driving
+at the same speed is run past its start up, then a window in which every
+vehicle takes thousands of steps is run. Claims are moved in place, so no
+Claim may be constructed in the window, and nothing the model allocates may
+outlive it
+"""
+
+import gc
+import tracemalloc
+from typing import Callable
+
+import tollstation as ts
+
+sim = ts.sim
+
+VEHICLE_NUM = 100
+SPACING = 8
+# 起步阶段,车辆第一次占用区域时创建的对象不计入
+SETTLE = 30
+WINDOW = 40
+# 窗口结束后每辆车每步允许残留的内存块数
+MAX_BLOCKS_PER_STEP = 0.01
+
+
+def _settled_lane() -> sim.Environment:
+    """
+    one lane of VEHICLE_NUM vehicles at velocity 5 in step mode, run till
+    SETTLE. ROAD_LENGTH is extended so that no vehicle leaves the road before
+    the end of the window
+    """
+    ts.set_headless()
+    ts.MOVEMENT_MODE = ts.MovementMode.STEP
+    ts.ROAD_LENGTH = VEHICLE_NUM * SPACING + 1000
+    env = sim.Environment()
+    claim_set = ts.ClaimSet(ts.ROAD_X_OFFSET)
+    # 车辆按从前到后的顺序进入车道
+    for i in reversed(range(VEHICLE_NUM)):
+        ts.Vehicle(
+            velocity=5,
+            x_pos=claim_set.x,
+            claim_set=claim_set,
+            vehicle_color=ts.VEHICLE_COLOR,
+            length_passed=i * SPACING,
+        )
+    env.run(till=SETTLE)
+    return env
+
+
+def _vehicle_steps() -> float:
+    return VEHICLE_NUM * 5 * WINDOW / ts.STEP_LENGTH
+
+
+def _count_claims(run: Callable[[], None]) -> int:
+    """
+    number of claims, moving or not, constructed by run()
+    """
+    init = ts.Claim.__init__
+    count = 0
+
+    def counting_init(self, *args, **kwargs):
+        nonlocal count
+        count += 1
+        init(self, *args, **kwargs)
+
+    ts.Claim.__init__ = counting_init
+    try:
+        run()
+    finally:
+        ts.Claim.__init__ = init
+    return count
+
+
+def _restoring(test):
+    def wrapper():
+        road_length = ts.ROAD_LENGTH
+        movement_mode = ts.MOVEMENT_MODE
+        try:
+            test()
+        finally:
+            ts.ROAD_LENGTH = road_length
+            ts.MOVEMENT_MODE = movement_mode
+
+    wrapper.__name__ = test.__name__
+    return wrapper
+
+
+@_restoring
+def test_no_claim_per_step():
+    env = _settled_lane()
+    claims = _count_claims(lambda: env.run(till=SETTLE + WINDOW))
+    assert claims == 0, f"{claims / _vehicle_steps():.3f} claims per step"
+
+
+@_restoring
+def test_model_retains_nothing():
+    """
+    memory blocks allocated by tollstation.py that are still alive after the
+    window, tracemalloc only sees live blocks, so this checks for leaks, not
+    for allocations per step
+    """
+    only_model = [tracemalloc.Filter(True, ts.__file__)]
+    # 从头开始跟踪,否则每步替换的对象都会算作新增
+    tracemalloc.start()
+    try:
+        env = _settled_lane()
+        gc.collect()
+        before = tracemalloc.take_snapshot().filter_traces(only_model)
+        env.run(till=SETTLE + WINDOW)
+        gc.collect()
+        after = tracemalloc.take_snapshot().filter_traces(only_model)
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "lineno"))
+    assert blocks / _vehicle_steps() < MAX_BLOCKS_PER_STEP, blocks
+
+
+if __name__ == "__main__":
+    test_no_claim_per_step()
+    test_model_retains_nothing()
+    print("ok")
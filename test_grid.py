@@ -0,0 +1,72 @@
+"""
+neighbour queries of SpatialGrid against a scan of all claims
+
+run with ``python -m pytest test_grid.py``. In continuous movement claims move
+between events without touching the grid, the queries are checked at times
+that fall between the events of most vehicles
+"""
+
+import tollstation as ts
+
+sim = ts.sim
+
+ROAD_NUM = 8
+ARRIVAL_INTERVAL = 3
+WINDOW = 10
+TIMES = (50.3, 128.71, 300)
+
+
+def _scan(claim: ts.Claim, claims: list[ts.Claim]) -> set[ts.Claim]:
+    x = claim.claim_set.x
+    return {
+        other
+        for other in claims
+        if other.claim_set is not claim.claim_set
+        and abs(other.claim_set.x - x) <= ts.ROAD_INTERVAL
+        and other.yl < claim.yu + WINDOW
+        and other.yu > claim.yl - WINDOW
+    }
+
+
+def _check(mode: ts.MovementMode) -> int:
+    """
+    :return: number of vehicle claims checked
+    """
+    ts.set_headless()
+    ts.MOVEMENT_MODE = mode
+    ts.ARRIVAL_INTERVAL = ARRIVAL_INTERVAL
+    env = sim.Environment()
+    roads = ts.create_roads(ROAD_NUM, seed=0, grid=ts.SpatialGrid())
+    checked = 0
+    for till in TIMES:
+        env.run(till=till)
+        claims = [claim for road in roads for claim in road.claim_set.claims]
+        for claim in claims:
+            if claim.type is ts.Claim.Type.VEHICLE:
+                assert set(claim.neighbours(WINDOW)) == _scan(claim, claims), till
+                checked += 1
+    return checked
+
+
+def _restoring(test):
+    def wrapper():
+        arrival_interval = ts.ARRIVAL_INTERVAL
+        movement_mode = ts.MOVEMENT_MODE
+        try:
+            test()
+        finally:
+            ts.ARRIVAL_INTERVAL = arrival_interval
+            ts.MOVEMENT_MODE = movement_mode
+
+    wrapper.__name__ = test.__name__
+    return wrapper
+
+
+@_restoring
+def test_neighbours_continuous():
+    assert _check(ts.MovementMode.CONTINUOUS) > 0
+
+
+@_restoring
+def test_neighbours_step():
+    assert _check(ts.MovementMode.STEP) > 0
@@ -0,0 +1,57 @@
+"""
+step and continuous movement give the same statistics
+
+run with ``python -m pytest test_movement.py``. Under congestion every manual
+lane keeps a queue, so its capacity is set by how soon the gate sees the
+vehicle in service clear it. Continuous movement must detect that at the same
+moment as step mode does
+"""
+
+import tollstation as ts
+
+sim = ts.sim
+
+ARRIVAL_INTERVAL = 3
+TILL = 400
+
+
+def _run(
+    mode: ts.MovementMode,
+) -> tuple[dict[str, float], list[tuple[str, int, float]]]:
+    """
+    statistics of all roads, and (toll type, passed, mean waiting time) per road
+    """
+    ts.set_headless()
+    ts.MOVEMENT_MODE = mode
+    ts.ARRIVAL_INTERVAL = ARRIVAL_INTERVAL
+    env = sim.Environment()
+    roads = ts.create_roads()
+    env.run(till=TILL)
+    per_road = [
+        (
+            road.gate.toll_type.name,
+            road.claim_set.time_in_system.number_of_entries(),
+            round(road.claim_set.waiting_time.mean(), 6),
+        )
+        for road in roads
+    ]
+    return ts.statistics(roads), per_road
+
+
+def test_congested_continuous_matches_step():
+    arrival_interval = ts.ARRIVAL_INTERVAL
+    movement_mode = ts.MOVEMENT_MODE
+    try:
+        step, step_roads = _run(ts.MovementMode.STEP)
+        continuous, continuous_roads = _run(ts.MovementMode.CONTINUOUS)
+    finally:
+        ts.ARRIVAL_INTERVAL = arrival_interval
+        ts.MOVEMENT_MODE = movement_mode
+    assert any(name == "MANUAL" and waiting > 0 for name, _, waiting in step_roads)
+    assert continuous_roads == step_roads
+    assert continuous["passed"] == step["passed"]
+
+
+if __name__ == "__main__":
+    test_congested_continuous_matches_step()
+    print("ok")
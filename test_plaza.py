@@ -0,0 +1,43 @@
+"""
+shared plaza approach in continuous movement
+
+run with ``python -m pytest test_plaza.py``. Random arrivals at the plaza
+queue up vehicles behind the start of busy lanes, whose generators have to be
+woken by the vehicle leaving the start, see test_trace.py
+"""
+
+import tollstation as ts
+import tollstation_plaza as tp
+
+sim = ts.sim
+
+ROAD_NUM = 10
+SEED = 3
+ARRIVAL_INTERVAL = 5
+TILL = 400
+
+
+def _run(mode: ts.MovementMode) -> tuple[dict[str, float], int]:
+    ts.set_headless()
+    ts.MOVEMENT_MODE = mode
+    ts.ARRIVAL_INTERVAL = ARRIVAL_INTERVAL
+    ts.EXPONENTIAL_ARRIVALS = True
+    env = sim.Environment()
+    roads, plaza = tp.create_plaza_roads(ROAD_NUM, seed=SEED)
+    env.run(till=TILL)
+    return ts.statistics(roads), plaza.arrivals
+
+
+def test_random_arrivals_continuous():
+    arrival_interval = ts.ARRIVAL_INTERVAL
+    exponential_arrivals = ts.EXPONENTIAL_ARRIVALS
+    movement_mode = ts.MOVEMENT_MODE
+    try:
+        step, step_arrivals = _run(ts.MovementMode.STEP)
+        continuous, continuous_arrivals = _run(ts.MovementMode.CONTINUOUS)
+    finally:
+        ts.ARRIVAL_INTERVAL = arrival_interval
+        ts.EXPONENTIAL_ARRIVALS = exponential_arrivals
+        ts.MOVEMENT_MODE = movement_mode
+    assert continuous_arrivals == step_arrivals
+    assert continuous["passed"] == step["passed"]
@@ -0,0 +1,54 @@
+"""
+trace-driven arrivals in continuous movement
+
+run with ``python -m pytest test_trace.py``. A burst of records queues up
+vehicles outside every lane, so each generator waits for the vehicle ahead to
+clear the start of the road over and over. It must be woken when that vehicle
+leaves instead of holding for the remaining distance, which rounds to no time
+at all when the claims almost touch
+"""
+
+import random
+
+import tollstation as ts
+import tollstation_trace as tt
+
+sim = ts.sim
+
+ROAD_NUM = 12
+RECORDS = 1500
+TILL = 150
+
+
+def _write_trace(path: str) -> None:
+    stream = random.Random(1)
+    t = 0.0
+    with open(path, "w") as file:
+        file.write("timestamp,lane,vehicle_class,etc\n")
+        for _ in range(RECORDS):
+            t += stream.expovariate(20)
+            lane = stream.randrange(ROAD_NUM)
+            file.write(f"{t:.3f},{lane},0,{stream.random() < 0.5}\n")
+
+
+def _run(path: str, mode: ts.MovementMode) -> tuple[dict[str, float], int]:
+    ts.set_headless()
+    ts.MOVEMENT_MODE = mode
+    env = sim.Environment()
+    roads, dispatcher = tt.create_trace_roads(tt.read_trace(path), road_num=ROAD_NUM)
+    env.run(till=TILL)
+    return ts.statistics(roads), dispatcher.dispatched
+
+
+def test_backlogged_trace_continuous(tmp_path):
+    path = str(tmp_path / "trace.csv")
+    _write_trace(path)
+    movement_mode = ts.MOVEMENT_MODE
+    try:
+        step, _ = _run(path, ts.MovementMode.STEP)
+        continuous, dispatched = _run(path, ts.MovementMode.CONTINUOUS)
+    finally:
+        ts.MOVEMENT_MODE = movement_mode
+    assert dispatched == RECORDS
+    # 进入道路的时刻取在步长的网格上,与步进模式只差个别车辆
+    assert abs(continuous["passed"] - step["passed"]) <= 0.01 * step["passed"]
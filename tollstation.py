@@ -1,7 +1,13 @@
 from __future__ import annotations
 
+import bisect
 import enum
-from typing import Optional
+import heapq
+import math
+import operator
+import random
+import sys
+from typing import Collection, Iterable, Iterator, Optional
 
 # import mySalabim_2dEnhanced as sim
 import mySalabim_3dEnhanced as sim
@@ -18,6 +24,8 @@ ROAD_INTERVAL = 10
 
 ENABLE_3D = True
 ENABLE_2D = False
+# 无界面运行:不创建任何动画对象,也不会导入图形相关的模块,见 set_headless()
+HEADLESS = False
 
 # simulator setting
 SIMULATE_SPEED = 1000
@@ -25,18 +33,576 @@ WINDOW_SIZE = 768
 SHOW_CLAIMS = True
 
 VEHICLE_COLOR = "blue"
+# 每条车道相邻两辆车的到达间隔
+ARRIVAL_INTERVAL = 10
+# 到达间隔服从均值为 ARRIVAL_INTERVAL 的指数分布,取自车道的随机流,False 为固定间隔
+EXPONENTIAL_ARRIVALS = False
+# ETC车道所占比例,按车道序号均匀分布,0.5 为人工和ETC交替
+ETC_RATIO = 0.5
 
 STEP_LENGTH = 1
+# 人工收费的服务时间,None 表示不计。数值、salabim 分布,或者分布的描述,例如
+# "Exponential(20)",或以 randomstream 为参数的工厂,例如
+# functools.partial(sim.Exponential, 20)。后两种可以 pickle,每个收费亭用
+# 车道的随机流各自创建分布,见 service_time_distribution()
+MANUAL_SERVICE_TIME = None
+# 回收驶离道路的车辆,供同一车道后续到达的车辆复用,见 Vehicle.arrive()
+POOL_VEHICLES = False
+# 空间网格单元的纵向长度,横向每条车道一个单元,见 SpatialGrid
+GRID_CELL_LENGTH = 20
+# 车辆速度变化时记录轨迹,见 tollstation_record.TrajectoryRecorder
+RECORDER = None
+# 局部可视化:只为与该区域相交的道路,闸门和车辆创建动画对象,None 表示全部,见 Viewport
+VIEWPORT = None
+VIEWPORT_REFRESH_INTERVAL = 10
+# 3D 动画的细节层次:远处的车辆画成一个面或一个点,见 mySalabim_3dEnhanced.Animate3dBox,
+# 车道每 DENSITY_SEGMENT_LENGTH 一段,段内车辆数达到 DENSE_VEHICLES 时画成按密度着色的色带
+LEVEL_OF_DETAIL = True
+DENSITY_SEGMENT_LENGTH = 50
+DENSE_VEHICLES = 6
+
+
+class MovementMode(enum.Enum):
+    # 每次前进 STEP_LENGTH
+    STEP = enum.auto()
+    # 匀速行驶到下一个冲突点(前车,关闭的闸门,ETC感应区),只在前车状态变化时重新计算
+    CONTINUOUS = enum.auto()
+    # 和 STEP 相同,但远离前车、闸门和ETC感应区时一步走完 STEP_LENGTH 整数倍的空闲距离
+    ADAPTIVE = enum.auto()
+
+
+MOVEMENT_MODE = MovementMode.STEP
+
+# 连续运动时判断两车相接的容差
+_EPSILON = 1e-9
+
+
+def set_headless() -> None:
+    """
+    switch to headless runs for batch jobs: no 2D or 3D animation objects are
+    created, so PIL and OpenGL are never imported, and the pympler memory
+    summary of mySalabim_3dEnhanced is off
+    """
+    global HEADLESS, ENABLE_2D, ENABLE_3D
+    HEADLESS = True
+    ENABLE_2D = False
+    ENABLE_3D = False
+    sim.SUMMARY_INTERVAL = sim.inf
 
 
 class ClaimSet:
-    def __init__(self, x_pos: float, show_animate: bool = False):
-        self.claims = set()
+    """
+    claims of one lane, kept sorted on yl so that interval queries are a
+    binary search followed by a scan over the claims that actually overlap
+
+    components blocked on a region wait on a claim covering it, see
+    Claim.wait(). Setting, resetting or moving a claim wakes only the waiters
+    overlapping the changed region
+    """
+
+    __slots__ = (
+        "claims",
+        "x",
+        "show_animate",
+        "zones",
+        "sensors",
+        "gates",
+        "first_vehicle",
+        "last_vehicle",
+        "vehicle_num",
+        "vehicles_in_lane",
+        "time_in_system",
+        "waiting_time",
+        "max_length",
+        "waiters",
+        "max_waiter_length",
+        "vehicle_pool",
+        "load_index",
+        "grid",
+        "density",
+    )
+
+    def __init__(
+        self, x_pos: float, show_animate: bool = False, grid: SpatialGrid = None
+    ):
+        self.claims: list[Claim] = []
         self.x = x_pos
         self.show_animate = show_animate
+        # 闸门和车辆生成器关注的区域,连续运动的车辆在进出这些区域时产生事件
+        self.zones: list[Claim] = []
+        # ETC检测区域,车辆进出时通知所属的闸门,见 Vehicle.__sense()
+        self.sensors: list[Claim] = []
+        # 闸门的claim,关闭时是车辆前方固定的障碍
+        self.gates: list[Claim] = []
+        # 车道内的车辆按先后顺序构成双向链表,见Vehicle.leader/follower
+        self.first_vehicle: Optional[Vehicle] = None
+        self.last_vehicle: Optional[Vehicle] = None
+        # 车道统计
+        self.vehicle_num = 0
+        self.vehicles_in_lane = sim.Monitor(f"vehicles in lane {x_pos}", level=True)
+        self.time_in_system = sim.Monitor(f"time in system {x_pos}")
+        self.waiting_time = sim.Monitor(f"waiting time {x_pos}")
+        # 只增不减,用于确定查询时需要向前回溯的范围
+        self.max_length = 0
+        # 等待区域变化的claim,同样按yl排序
+        self.waiters: list[Claim] = []
+        self.max_waiter_length = 0
+        # 驶离道路后等待复用的车辆
+        self.vehicle_pool: list[Vehicle] = []
+        # 收费广场的车道负载索引,车辆驶离时更新,见 tollstation_plaza
+        self.load_index = None
+        # 所有车道共享的空间网格,用于查询相邻车道的claim
+        self.grid = grid
+        # 车道各路段的车辆数,只在画色带时存在,见 DensityStrip
+        self.density: Optional[LaneDensity] = None
+
+    def __len__(self) -> int:
+        return len(self.claims)
+
+    def __contains__(self, claim: Claim) -> bool:
+        return self._index(claim) is not None
+
+    def _index(self, claim: Claim) -> Optional[int]:
+        return _index_of(self.claims, claim)
+
+    def add(self, claim: Claim) -> None:
+        length = claim.yu - claim.yl
+        if length > self.max_length:
+            self.max_length = length
+        # 插在yl相同(或只差舍入误差)的claim之前:闸门落下时驶过的车辆可能还
+        # 压在闸门上,它的yl随后增大,排在闸门之后才能保持有序
+        i = bisect.bisect_left(self.claims, claim.yl - _EPSILON, key=_claim_yl)
+        self.claims.insert(i, claim)
+        if self.grid is not None:
+            self.grid.add(claim)
+        if self.density is not None and claim.type is Claim.Type.VEHICLE:
+            self.density.place(claim)
+        self.notify(claim.yl, claim.yu)
+
+    def remove(self, claim: Claim) -> None:
+        i = self._index(claim)
+        if i is None:
+            raise KeyError(claim)
+        del self.claims[i]
+        if self.grid is not None:
+            self.grid.remove(claim)
+        if self.density is not None and claim.type is Claim.Type.VEHICLE:
+            self.density.remove(claim)
+        self.notify(claim.yl, claim.yu)
+
+    def move(self, claim: Claim, y_lower: float, y_upper: float) -> None:
+        """
+        move claim to [y_lower, y_upper), the list entry is only shifted when
+        the claim passes one of its neighbours
+        """
+        claims = self.claims
+        i = self._index(claim)
+        if i is None:
+            raise KeyError(claim)
+        changed_lower = min(claim.yl, y_lower)
+        changed_upper = max(claim.yu, y_upper)
+        claim.yl = y_lower
+        claim.yu = y_upper
+        if self.grid is not None:
+            self.grid.move(claim, y_lower, y_upper)
+        if self.density is not None and claim.type is Claim.Type.VEHICLE:
+            self.density.place(claim)
+        if (i > 0 and claims[i - 1].yl > y_lower) or (
+            i + 1 < len(claims) and claims[i + 1].yl < y_lower
+        ):
+            del claims[i]
+            bisect.insort_right(claims, claim, key=_claim_yl)
+        if y_upper - y_lower > self.max_length:
+            self.max_length = y_upper - y_lower
+        self.notify(changed_lower, changed_upper)
+
+    def enter(self, vehicle: Vehicle) -> None:
+        """
+        link vehicle behind the last vehicle of the lane
+        """
+        vehicle.leader = self.last_vehicle
+        vehicle.follower = None
+        if self.last_vehicle is None:
+            self.first_vehicle = vehicle
+        else:
+            self.last_vehicle.follower = vehicle
+        self.last_vehicle = vehicle
+        self.vehicle_num += 1
+        self.vehicles_in_lane.tally(self.vehicle_num)
+
+    def leave(self, vehicle: Vehicle) -> None:
+        if vehicle.leader is None:
+            self.first_vehicle = vehicle.follower
+        else:
+            vehicle.leader.follower = vehicle.follower
+        if vehicle.follower is None:
+            self.last_vehicle = vehicle.leader
+        else:
+            vehicle.follower.leader = vehicle.leader
+        vehicle.leader = None
+        vehicle.follower = None
+        self.vehicle_num -= 1
+        self.vehicles_in_lane.tally(self.vehicle_num)
+        if self.load_index is not None:
+            self.load_index.decrement(self)
+
+    def watch(self, claim: Claim) -> None:
+        length = claim.yu - claim.yl
+        if length > self.max_waiter_length:
+            self.max_waiter_length = length
+        bisect.insort_right(self.waiters, claim, key=_claim_yl)
+
+    def unwatch(self, claim: Claim) -> None:
+        i = _index_of(self.waiters, claim)
+        if i is not None:
+            del self.waiters[i]
+
+    def notify(self, y_lower: float, y_upper: float) -> None:
+        """
+        activate the passive owners of the waiters overlapping [y_lower, y_upper)
+        """
+        waiters = self.waiters
+        if not waiters:
+            return
+        i = bisect.bisect_right(
+            waiters, y_lower - self.max_waiter_length, key=_claim_yl
+        )
+        n = len(waiters)
+        while i < n:
+            c = waiters[i]
+            if c.yl >= y_upper:
+                return
+            if c.yu > y_lower and c.component.ispassive():
+                c.component.activate()
+            i += 1
+
+    def overlapping(self, y_lower: float, y_upper: float) -> Iterator[Claim]:
+        """
+        claims c with c.yl < y_upper and c.yu > y_lower, in order of yl
+        """
+        claims = self.claims
+        i = bisect.bisect_right(claims, y_lower - self.max_length, key=_claim_yl)
+        n = len(claims)
+        while i < n:
+            c = claims[i]
+            if c.yl >= y_upper:
+                return
+            if c.yu > y_lower:
+                yield c
+            i += 1
+
+    def successor(self, claim: Claim) -> Optional[Claim]:
+        i = self._index(claim) + 1
+        return self.claims[i] if i < len(self.claims) else None
+
+    def predecessor(self, claim: Claim) -> Optional[Claim]:
+        i = self._index(claim) - 1
+        return self.claims[i] if i >= 0 else None
+
+    def find(
+        self,
+        y_lower: float,
+        y_upper: float,
+        ignore: Claim | Collection[Claim] = None,
+        claim_type: Claim.Type = None,
+    ) -> Optional[Claim]:
+        """
+        first claim overlapping [y_lower, y_upper) that is not ignored and, if
+        claim_type is given, is of that type
+
+        unlike overlapping() this allocates nothing, it is meant for the
+        checks done on every movement of a vehicle
+
+        :param ignore: a claim, or a collection of claims kept by the caller
+        """
+        if ignore is None or isinstance(ignore, Claim):
+            ignored = ()
+        else:
+            ignored, ignore = ignore, None
+        claims = self.claims
+        i = bisect.bisect_right(claims, y_lower - self.max_length, key=_claim_yl)
+        n = len(claims)
+        while i < n:
+            c = claims[i]
+            if c.yl >= y_upper:
+                return None
+            if (
+                c.yu > y_lower
+                and (claim_type is None or c.type is claim_type)
+                and c is not ignore
+                and c not in ignored
+            ):
+                return c
+            i += 1
+        return None
+
+    def ahead(self, y: float) -> Optional[Claim]:
+        """
+        first claim that starts at or after y
+        """
+        i = bisect.bisect_left(self.claims, y, key=_claim_yl)
+        return self.claims[i] if i < len(self.claims) else None
+
+    def behind(self, y: float) -> Optional[Claim]:
+        """
+        last claim, in order of yl, that ends at or before y
+        """
+        claims = self.claims
+        i = bisect.bisect_left(claims, y, key=_claim_yl) - 1
+        lowest = y - self.max_length
+        while i >= 0 and claims[i].yl >= lowest:
+            if claims[i].yu <= y:
+                return claims[i]
+            i -= 1
+        # 没有更长的claim能越过lowest,再往前第一个就是最近的
+        return claims[i] if i >= 0 else None
+
+
+_claim_yl = operator.attrgetter("yl")
+
+
+class SpatialGrid:
+    """
+    set claims of all lanes hashed on cells of one lane (x) by GRID_CELL_LENGTH
+    (y), so neighbourhood queries only visit the cells around the query window
+
+    a claim is registered in every cell it overlaps. Moving it only touches the
+    cells it enters or leaves, which for short steps is rarely any. A moving
+    claim is registered over the whole range it sweeps till its next planned
+    move, see MovingClaim.move(), so queries stay correct while it moves
+    without events
+    """
+
+    __slots__ = ("cell_width", "cell_length", "cells", "rows")
+
+    def __init__(
+        self, cell_width: float = ROAD_INTERVAL, cell_length: float = GRID_CELL_LENGTH
+    ):
+        self.cell_width = cell_width
+        self.cell_length = cell_length
+        # (列, 行) -> 单元内的claim,dict 当作有序集合使用
+        self.cells: dict[tuple[int, int], dict[Claim, None]] = {}
+        # 每个claim登记所在的行
+        self.rows: dict[Claim, range] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, claim: Claim) -> bool:
+        return claim in self.rows
+
+    def _column(self, x: float) -> int:
+        return math.floor(x / self.cell_width)
+
+    def _rows(self, y_lower: float, y_upper: float) -> range:
+        return range(
+            math.floor(y_lower / self.cell_length),
+            math.floor(y_upper / self.cell_length) + 1,
+        )
+
+    def _register(self, claim: Claim, column: int, rows: Iterable[int]) -> None:
+        cells = self.cells
+        for row in rows:
+            cell = cells.get((column, row))
+            if cell is None:
+                cells[column, row] = cell = {}
+            cell[claim] = None
+
+    def _unregister(self, claim: Claim, column: int, rows: Iterable[int]) -> None:
+        cells = self.cells
+        for row in rows:
+            cell = cells[column, row]
+            del cell[claim]
+            if not cell:
+                del cells[column, row]
+
+    def add(self, claim: Claim) -> None:
+        rows = self._rows(claim.yl, claim.yu)
+        self.rows[claim] = rows
+        self._register(claim, self._column(claim.claim_set.x), rows)
+
+    def remove(self, claim: Claim) -> None:
+        rows = self.rows.pop(claim)
+        self._unregister(claim, self._column(claim.claim_set.x), rows)
+
+    def move(self, claim: Claim, y_lower: float, y_upper: float) -> None:
+        """
+        register claim at [y_lower, y_upper) instead of where it was
+        """
+        old = self.rows[claim]
+        new = self._rows(y_lower, y_upper)
+        if new == old:
+            return
+        self.rows[claim] = new
+        column = self._column(claim.claim_set.x)
+        self._unregister(claim, column, (row for row in old if row not in new))
+        self._register(claim, column, (row for row in new if row not in old))
+
+    def query(
+        self, x_lower: float, x_upper: float, y_lower: float, y_upper: float
+    ) -> Iterator[Claim]:
+        """
+        claims of lanes with x_lower <= x <= x_upper overlapping
+        [y_lower, y_upper), each once
+        """
+        cells = self.cells
+        rows = self._rows(y_lower, y_upper)
+        seen = set()
+        for column in range(self._column(x_lower), self._column(x_upper) + 1):
+            for row in rows:
+                cell = cells.get((column, row))
+                if cell is None:
+                    continue
+                for claim in cell:
+                    if (
+                        claim not in seen
+                        and x_lower <= claim.claim_set.x <= x_upper
+                        and claim.yl < y_upper
+                        and claim.yu > y_lower
+                    ):
+                        seen.add(claim)
+                        yield claim
+
+
+class LaneDensity:
+    """
+    vehicles of one lane per segment of DENSITY_SEGMENT_LENGTH, kept up to
+    date as their claims move instead of being recounted every frame
+
+    a vehicle is registered in the segment of the middle of its claim when
+    the claim is set or moved. Moving claims cross segment boundaries without
+    events, the next crossing of every moving claim is kept in a heap and
+    applied by update(), so a frame only handles the vehicles that changed
+    segment since the previous one. A segment holding DENSE_VEHICLES or more
+    is dense and the boxes of its vehicles are hidden, see
+    Vehicle.set_lod_hidden()
+    """
+
+    __slots__ = (
+        "segment_length",
+        "segments",
+        "segment_of",
+        "dense",
+        "crossings",
+        "pending",
+        "seq",
+    )
+
+    def __init__(self, segment_length: float = None):
+        self.segment_length = (
+            DENSITY_SEGMENT_LENGTH if segment_length is None else segment_length
+        )
+        # 路段 -> 路段内的车辆,dict 当作有序集合使用
+        self.segments: dict[int, dict[Vehicle, None]] = {}
+        self.segment_of: dict[Vehicle, int] = {}
+        self.dense: set[int] = set()
+        # 运动的claim下一次跨越路段边界 (时刻, 序号, claim, 进入的路段),
+        # 重新登记的车辆的旧条目留在堆中,取出时跳过
+        self.crossings: list[tuple[float, int, MovingClaim, int]] = []
+        self.pending: dict[Vehicle, tuple] = {}
+        self.seq = 0
+
+    def __len__(self) -> int:
+        return len(self.segment_of)
+
+    def _segment(self, y: float) -> int:
+        return math.floor(y / self.segment_length)
+
+    def place(self, claim: Claim) -> None:
+        """
+        register the vehicle of claim where the claim is now
+        """
+        segment = self._segment((claim.yl + claim.yu) / 2)
+        self._assign(claim.component, segment)
+        if claim.v:
+            self._schedule(claim, segment)
+        else:
+            self.pending.pop(claim.component, None)
+
+    def remove(self, claim: Claim) -> None:
+        vehicle = claim.component
+        self.pending.pop(vehicle, None)
+        segment = self.segment_of.pop(vehicle, None)
+        if segment is not None:
+            self._leave(vehicle, segment)
+
+    def update(self, t: float) -> None:
+        """
+        apply the segment crossings of moving claims up to t
+        """
+        crossings = self.crossings
+        pending = self.pending
+        while crossings and crossings[0][0] <= t:
+            entry = heapq.heappop(crossings)
+            claim = entry[2]
+            if pending.get(claim.component) is not entry:
+                continue
+            self._assign(claim.component, entry[3])
+            self._schedule(claim, entry[3])
+
+    def clear(self) -> None:
+        for vehicle in self.segment_of:
+            vehicle.set_lod_hidden(False)
+        self.segments.clear()
+        self.segment_of.clear()
+        self.dense.clear()
+        self.crossings.clear()
+        self.pending.clear()
+
+    def _schedule(self, claim: MovingClaim, segment: int) -> None:
+        # claim 在 t0 时的中点,跨越路段上边界的时刻
+        y0 = (claim._yl0 + claim._yu0) / 2
+        t = claim.t0 + ((segment + 1) * self.segment_length - y0) / claim.v
+        self.seq += 1
+        self.pending[claim.component] = entry = (t, self.seq, claim, segment + 1)
+        heapq.heappush(self.crossings, entry)
+
+    def _assign(self, vehicle: Vehicle, segment: int) -> None:
+        old = self.segment_of.get(vehicle)
+        if old == segment:
+            return
+        if old is not None:
+            self._leave(vehicle, old)
+        self.segment_of[vehicle] = segment
+        vehicles = self.segments.get(segment)
+        if vehicles is None:
+            self.segments[segment] = vehicles = {}
+        vehicles[vehicle] = None
+        if segment in self.dense:
+            vehicle.set_lod_hidden(True)
+        elif len(vehicles) >= DENSE_VEHICLES:
+            self.dense.add(segment)
+            for other in vehicles:
+                other.set_lod_hidden(True)
+
+    def _leave(self, vehicle: Vehicle, segment: int) -> None:
+        vehicles = self.segments[segment]
+        del vehicles[vehicle]
+        vehicle.set_lod_hidden(False)
+        if segment in self.dense and len(vehicles) < DENSE_VEHICLES:
+            self.dense.discard(segment)
+            for other in vehicles:
+                other.set_lod_hidden(False)
+        if not vehicles:
+            del self.segments[segment]
+
+
+def _index_of(claims: list[Claim], claim: Claim) -> Optional[int]:
+    i = bisect.bisect_left(claims, claim.yl, key=_claim_yl)
+    n = len(claims)
+    while i < n and claims[i].yl == claim.yl:
+        if claims[i] is claim:
+            return i
+        i += 1
+    return None
 
 
 class Claim:
+    __slots__ = ("yl", "yu", "claim_set", "an", "is_set", "component", "type")
+
+    # claims move only through their owner, see MovingClaim
+    v = 0
+
     class Type(enum.Enum):
         ETC = enum.auto()
         GATE = enum.auto()
@@ -56,11 +622,13 @@ class Claim:
         self.yu = y_upper
         self.claim_set = claim_set
         self.an = None
+        self.is_set = False
         self.component = component
         self.type = claim_type
 
     def set(self) -> None:
-        self.claim_set.claims.add(self)
+        self.claim_set.add(self)
+        self.is_set = True
         if ENABLE_2D and self.claim_set.show_animate:
             self.an = sim.AnimateRectangle(
                 spec=(
@@ -73,28 +641,163 @@ class Claim:
             )
 
     def reset(self) -> None:
-        self.claim_set.claims.remove(self)
+        self.claim_set.remove(self)
+        self.is_set = False
         if ENABLE_2D and self.claim_set.show_animate:
             self.an.remove()
+            self.an = None
+
+    def move_to(self, y_lower: float, y_upper: float) -> None:
+        """
+        move the claim in place instead of resetting it and setting a new one
+        """
+        if self.is_set:
+            self.claim_set.move(self, y_lower, y_upper)
+        else:
+            self.yl = y_lower
+            self.yu = y_upper
+        if self.an is not None:
+            self.an.spec = (
+                self.claim_set.x - ROAD_WIDTH / 2,
+                y_lower,
+                self.claim_set.x + ROAD_WIDTH / 2,
+                y_upper,
+            )
+
+    def wait(self) -> None:
+        """
+        passivate the component until a claim overlapping this one is set,
+        reset or moved
+        """
+        self.claim_set.watch(self)
+        self.component.passivate()
+        self.claim_set.unwatch(self)
 
-    # todo 改进算法减少计算量
-    # 比如可以采用多个set,或者更高效的算法
     def get_gate_next_to(self) -> Optional[Claim]:
-        for c in self.claim_set.claims:
-            if c.type == Claim.Type.GATE and c.yl < self.yu and c.yu > self.yl:
-                return c
-        return None
+        return self.overlapping(claim_type=Claim.Type.GATE)
+
+    def get_claim_ahead(self) -> Optional[Claim]:
+        """
+        next claim in the claim set, the claim itself must be set
+        """
+        return self.claim_set.successor(self)
+
+    def get_claim_behind(self) -> Optional[Claim]:
+        """
+        previous claim in the claim set, the claim itself must be set
+        """
+        return self.claim_set.predecessor(self)
+
+    def overlapping(
+        self, ignore: Claim | Collection[Claim] = None, claim_type: Claim.Type = None
+    ) -> Optional[Claim]:
+        """
+        first claim of the claim set overlapping this one
+
+        :param ignore: claims that do not count, e.g. the own claim of a vehicle,
+            see ClaimSet.find()
+        :param claim_type: if given, only claims of this type count
+        """
+        return self.claim_set.find(self.yl, self.yu, ignore, claim_type)
+
+    def overlaps(
+        self, ignore: Claim | Collection[Claim] = None, claim_type: Claim.Type = None
+    ) -> bool:
+        return self.claim_set.find(self.yl, self.yu, ignore, claim_type) is not None
+
+    def neighbours(self, window: float, lanes: int = 1) -> Iterator[Claim]:
+        """
+        claims of the lanes up to lanes lanes to either side that overlap this
+        claim extended by window before and after, the claim set must be on a
+        SpatialGrid
+        """
+        claim_set = self.claim_set
+        dx = lanes * ROAD_INTERVAL
+        for claim in claim_set.grid.query(
+            claim_set.x - dx, claim_set.x + dx, self.yl - window, self.yu + window
+        ):
+            if claim.claim_set is not claim_set:
+                yield claim
+
+
+class MovingClaim(Claim):
+    """
+    claim moving with velocity v since t0, yl and yu are evaluated at the
+    current simulation time
 
-    # def get_vehicle_next_to_behind(self) -> Optional[Claim]:
-    #     for c in self.claim_set.claims:
-    #         if c.type == Claim.Type.VEHICLE and abs(self.yl - c.yu) <= STEP_LENGTH:
-    #             return c
-    #     assert False
+    vehicles never overtake each other, so moving claims keep their order in
+    the claim set without being reinserted
+    """
+
+    __slots__ = ("env", "v", "t0", "_yl0", "_yu0")
+
+    def __init__(
+        self,
+        y_lower: float,
+        y_upper: float,
+        claim_set: ClaimSet,
+        component: sim.Component,
+        claim_type: Claim.Type,
+        velocity: float = 0,
+    ):
+        self.env = component.env
+        self.v = velocity
+        self.t0 = self.env.now()
+        super().__init__(y_lower, y_upper, claim_set, component, claim_type)
 
-    def overlaps(self, claims: set = None) -> bool:
-        if claims is None:
-            claims = self.claim_set.claims
-        return any(claim.yl < self.yu and claim.yu > self.yl for claim in claims)
+    @property
+    def yl(self) -> float:
+        return self._yl0 + self.v * (self.env.now() - self.t0)
+
+    @yl.setter
+    def yl(self, value: float) -> None:
+        self._yl0 = value
+
+    @property
+    def yu(self) -> float:
+        return self._yu0 + self.v * (self.env.now() - self.t0)
+
+    @yu.setter
+    def yu(self, value: float) -> None:
+        self._yu0 = value
+
+    def move(
+        self, y_lower: float, y_upper: float, velocity: float, until: float = None
+    ) -> None:
+        """
+        place the claim at [y_lower, y_upper) now and let it move with velocity,
+        like move_to() of a claim that is not set this notifies nobody, set()
+        does when the claim is placed
+
+        :param until: time of the next move, the claim is registered on the
+            SpatialGrid over the range it sweeps till then, by default till it
+            reaches the end of the road
+        """
+        # 自上次move以来扫过的区域
+        changed_lower = min(self._yl0, y_lower)
+        changed_upper = max(self.yu, y_upper)
+        self._yl0 = y_lower
+        self._yu0 = y_upper
+        self.v = velocity
+        self.t0 = self.env.now()
+        if not self.is_set:
+            return
+        claim_set = self.claim_set
+        if claim_set.grid is not None:
+            if velocity == 0:
+                reach = y_upper
+            elif until is None:
+                reach = ROAD_LENGTH + (y_upper - y_lower)
+            else:
+                reach = y_upper + velocity * (until - self.t0)
+            # 留出舍入误差,yu 在 until 时刻可能略大于 reach
+            claim_set.grid.move(self, y_lower, max(reach, y_upper) + _EPSILON)
+        if claim_set.density is not None and self.type is Claim.Type.VEHICLE:
+            claim_set.density.place(self)
+        claim_set.notify(changed_lower, changed_upper)
+
+    def move_to(self, y_lower: float, y_upper: float) -> None:
+        self.move(y_lower, y_upper, self.v)
 
 
 class Road:
@@ -105,32 +808,332 @@ class Road:
         road_color: str,
         toll_type: Gate.Type,
         show_claims: bool = False,
+        random_stream: random.Random = None,
+        vehicle_generator_class: type[VehicleGenerator] = None,
+        grid: SpatialGrid = None,
     ):
         """
         :param x_pos: mid x-coordinate of Road
+        :param random_stream: random stream of the vehicle generator and of
+            the service time of a manual gate, defaults to the global stream
+            of the environment
+        :param vehicle_generator_class: VehicleGenerator or a subclass
+        :param grid: registers the claims of the road, see SpatialGrid
         """
-        claim_set = ClaimSet(x_pos, show_claims)
-        half_width = ROAD_WIDTH / 2
-        sim.AnimateRectangle(
-            spec=(x_pos - half_width, 0, x_pos + half_width, ROAD_LENGTH),
-            fillcolor=ROAD_COLOR,
-        )
-        gate = GATE_TYPE_2_SUBCLASS[toll_type](
-            toll_type=toll_type, x_pos=x_pos, claim_set=claim_set
+        self.claim_set = ClaimSet(x_pos, show_claims, grid)
+        self.x = x_pos
+        self.road_color = road_color
+        self.animation_objects: list = []
+        self.gate = GATE_TYPE_2_SUBCLASS[toll_type](
+            toll_type=toll_type,
+            x_pos=x_pos,
+            claim_set=self.claim_set,
+            random_stream=random_stream,
         )
-        vehicle_generator = VehicleGenerator(
+        if VIEWPORT is None:
+            self.attach_animation()
+            self.gate.attach_animation()
+        else:
+            VIEWPORT.add(self)
+        if vehicle_generator_class is None:
+            vehicle_generator_class = VehicleGenerator
+        self.vehicle_generator = vehicle_generator_class(
             x_pos=x_pos,
             vehicle_color=vehicle_color,
-            claim_set=claim_set,
+            claim_set=self.claim_set,
+            random_stream=random_stream,
+        )
+
+    def attach_animation(self) -> None:
+        if self.animation_objects:
+            return
+        half_width = ROAD_WIDTH / 2
+        x0 = self.x - half_width
+        y0 = 0
+        x1 = self.x + half_width
+        y1 = ROAD_LENGTH
+        if ENABLE_2D:
+            self.animation_objects.append(
+                sim.AnimateRectangle(
+                    spec=(x0, y0, x1, y1),
+                    fillcolor=self.road_color,
+                )
+            )
+        if ENABLE_3D:
+            self.animation_objects.append(
+                sim.Animate3dRectangle(
+                    x0=x0, y0=y0, x1=x1, y1=y1, color=self.road_color
+                )
+            )
+            if LEVEL_OF_DETAIL:
+                self.animation_objects.append(DensityStrip(claim_set=self.claim_set))
+
+    def detach_animation(self) -> None:
+        for animation_object in self.animation_objects:
+            animation_object.remove()
+        self.animation_objects.clear()
+
+
+class DensityStrip(sim.Animate3dBase):
+    """
+    dense segments of a lane drawn as one strip each instead of as boxes
+
+    the vehicles of the lane are counted per segment of DENSITY_SEGMENT_LENGTH
+    by a LaneDensity as their claims move, a segment holding DENSE_VEHICLES or
+    more is drawn as a strip coloured from green (DENSE_VEHICLES) to red
+    (bumper to bumper) and the boxes of its vehicles are taken out of the
+    animation, so the work per frame depends on the number of strips and
+    visible boxes instead of on the number of vehicles
+    """
+
+    def setup(self, claim_set: ClaimSet):
+        self.claim_set = claim_set
+        density = LaneDensity()
+        for claim in claim_set.claims:
+            if claim.type is Claim.Type.VEHICLE:
+                density.place(claim)
+        claim_set.density = density
+        # 动画对象按layer从小到大绘制,先于车辆(layer 0)更新路段
+        self.layer = -1
+
+    def remove(self) -> None:
+        if self.claim_set.density is not None:
+            self.claim_set.density.clear()
+            self.claim_set.density = None
+        super().remove()
+
+    def draw(self, t):
+        density = self.claim_set.density
+        density.update(t)
+        x = self.claim_set.x
+        capacity = DENSITY_SEGMENT_LENGTH / Vehicle.LENGTH
+        for segment in density.dense:
+            vehicles = len(density.segments[segment])
+            color = self.env.colorinterpolate(
+                vehicles, DENSE_VEHICLES, capacity, "green", "red"
+            )
+            sim.draw_rectangle3d(
+                x0=x - ROAD_WIDTH / 2,
+                y0=segment * DENSITY_SEGMENT_LENGTH,
+                z=0.5,
+                x1=x + ROAD_WIDTH / 2,
+                y1=(segment + 1) * DENSITY_SEGMENT_LENGTH,
+                gl_color=self.env.colorspec_to_gl_color(color),
+            )
+
+
+class Viewport(sim.Component):
+    """
+    region x0 <= x <= x1, y0 <= y <= y1 of the model that is animated, set as
+    VIEWPORT before the roads are created
+
+    roads and gates have their animation objects only while they intersect
+    the region. Every refresh_interval the vehicles overlapping the region
+    extended by margin are looked up in the claim sets of the lanes crossing
+    it, vehicles get their animation objects when they come in and lose them
+    when they go, so animation objects and the work per frame depend on what
+    is visible instead of on the number of vehicles
+
+    margin defaults to the distance the fastest vehicle drives in
+    refresh_interval, so vehicles are attached before they enter the region
+    """
+
+    def setup(
+        self,
+        x0: float,
+        y0: float,
+        x1: float,
+        y1: float,
+        refresh_interval: float = None,
+        margin: float = None,
+    ):
+        self.refresh_interval = (
+            VIEWPORT_REFRESH_INTERVAL if refresh_interval is None else refresh_interval
         )
+        self.margin = (
+            VehicleGenerator.FASTEST_V * self.refresh_interval
+            if margin is None
+            else margin
+        )
+        self.roads: list[Road] = []
+        # 与区域相交的车道
+        self.claim_sets: list[ClaimSet] = []
+        self.vehicles: set[Vehicle] = set()
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+
+    def process(self):
+        while True:
+            self.refresh()
+            self.hold(self.refresh_interval)
+
+    def __crosses_lane(self, x: float) -> bool:
+        return x - ROAD_WIDTH / 2 <= self.x1 and x + ROAD_WIDTH / 2 >= self.x0
+
+    def __attach_road(self, road: Road) -> None:
+        gate = road.gate
+        crosses = self.__crosses_lane(road.x)
+        if crosses:
+            self.claim_sets.append(road.claim_set)
+        if crosses and self.y0 <= ROAD_LENGTH and self.y1 >= 0:
+            road.attach_animation()
+        else:
+            road.detach_animation()
+        # ETC感应区在闸门之前 ETC_DISTANCE
+        if crosses and self.y0 <= gate.dis and self.y1 >= gate.dis - Gate.ETC_DISTANCE:
+            gate.attach_animation()
+        else:
+            gate.detach_animation()
+
+    def add(self, road: Road) -> None:
+        self.roads.append(road)
+        self.__attach_road(road)
+
+    def move_to(self, x0: float, y0: float, x1: float, y1: float) -> None:
+        """
+        select another region, e.g. after the user dragged a new rectangle
+        """
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        self.claim_sets = []
+        for road in self.roads:
+            self.__attach_road(road)
+        self.refresh()
+
+    def contains(self, vehicle: Vehicle) -> bool:
+        claim = vehicle.claim
+        return (
+            vehicle.claim_set in self.claim_sets
+            and claim.yl < self.y1 + self.margin
+            and claim.yu > self.y0 - self.margin
+        )
+
+    def attach(self, vehicle: Vehicle) -> None:
+        vehicle.attach_animation()
+        self.vehicles.add(vehicle)
+
+    def detach(self, vehicle: Vehicle) -> None:
+        vehicle.detach_animation()
+        self.vehicles.discard(vehicle)
+
+    def refresh(self) -> None:
+        visible = set()
+        for claim_set in self.claim_sets:
+            for claim in claim_set.overlapping(
+                self.y0 - self.margin, self.y1 + self.margin
+            ):
+                if claim.type is Claim.Type.VEHICLE:
+                    visible.add(claim.component)
+        for vehicle in self.vehicles - visible:
+            vehicle.detach_animation()
+        for vehicle in visible - self.vehicles:
+            vehicle.attach_animation()
+        self.vehicles = visible
+
+
+def lane_random_stream(seed: int, lane: int) -> random.Random:
+    """
+    random stream of one lane, only depends on seed and the lane index so a lane
+    behaves the same no matter which or how many lanes are simulated with it
+    """
+    return random.Random(f"{seed}.{lane}")
+
+
+def toll_type_of(lane: int) -> Gate.Type:
+    """
+    gate type of a lane, ETC_RATIO of the lanes are spread evenly as ETC lanes
+    starting with a manual lane
+    """
+    if math.floor((lane + 1) * ETC_RATIO) > math.floor(lane * ETC_RATIO):
+        return Gate.Type.ETC
+    return Gate.Type.MANUAL
+
+
+def service_time_distribution(random_stream: random.Random = None):
+    """
+    MANUAL_SERVICE_TIME of one booth: a spec string or a factory becomes a
+    distribution drawing from random_stream, numbers and distributions are
+    returned as they are
+    """
+    service_time = MANUAL_SERVICE_TIME
+    if isinstance(service_time, str):
+        return sim.Distribution(service_time, randomstream=random_stream)
+    if callable(service_time) and not isinstance(service_time, sim._Distribution):
+        return service_time(randomstream=random_stream)
+    return service_time
+
+
+def create_roads(
+    road_num: int = None,
+    seed: int = None,
+    lanes: Iterable[int] = None,
+    vehicle_generator_class: type[VehicleGenerator] = None,
+    grid: SpatialGrid = None,
+) -> list[Road]:
+    """
+    roads with the gate mix of toll_type_of()
+
+    :param road_num: defaults to ROAD_NUM
+    :param seed: if given, every road gets its own random stream, see
+        lane_random_stream()
+    :param lanes: indices of the roads to create, defaults to all road_num roads
+    :param vehicle_generator_class: see Road
+    :param grid: see Road
+    """
+    if lanes is None:
+        lanes = range(ROAD_NUM if road_num is None else road_num)
+    return [
+        Road(
+            x_pos=ROAD_X_OFFSET + i * ROAD_INTERVAL,
+            vehicle_color=VEHICLE_COLOR,
+            road_color=ROAD_COLOR,
+            toll_type=toll_type_of(i),
+            show_claims=SHOW_CLAIMS,
+            random_stream=None if seed is None else lane_random_stream(seed, i),
+            vehicle_generator_class=vehicle_generator_class,
+            grid=grid,
+        )
+        for i in lanes
+    ]
+
+
+def statistics(roads: Iterable[Road]) -> dict[str, float]:
+    """
+    summary of all roads: number of vehicles that passed, mean time in system,
+    mean waiting time (time in system minus free driving time) and the mean
+    total number of vehicles on the roads
+    """
+    claim_sets = [road.claim_set for road in roads]
+    return monitor_statistics(
+        [claim_set.time_in_system for claim_set in claim_sets],
+        [claim_set.waiting_time for claim_set in claim_sets],
+        [claim_set.vehicles_in_lane for claim_set in claim_sets],
+    )
+
+
+def monitor_statistics(
+    time_in_system: list[sim.Monitor],
+    waiting_time: list[sim.Monitor],
+    vehicles_in_lane: list[sim.Monitor],
+) -> dict[str, float]:
+    """
+    statistics() of the per-lane monitors, all monitors must belong to the same
+    environment
+    """
+    merged_time_in_system = time_in_system[0].merge(*time_in_system[1:])
+    merged_waiting_time = waiting_time[0].merge(*waiting_time[1:])
+    return {
+        "passed": merged_time_in_system.number_of_entries(),
+        "time_in_system": merged_time_in_system.mean(),
+        "waiting_time": merged_waiting_time.mean(),
+        "vehicles_in_lane": sum(monitor.mean() for monitor in vehicles_in_lane),
+    }
 
 
 class Gate(sim.Component):
     __GATE_WIDTH = ROAD_WIDTH
-    __GATE_LENGTH = 1
+    GATE_LENGTH = 1
     _MOVE_TIME = 1
     _MOVE_SPEED = float(ROAD_WIDTH) / _MOVE_TIME
-    __ETC_DISTANCE = 15
+    ETC_DISTANCE = 15
     __ETC_SENSOR_WIDTH = 1
 
     class Status(enum.Enum):
@@ -155,19 +1158,60 @@ class Gate(sim.Component):
         toll_type: Gate.Type,
         x_pos: float,
         claim_set: ClaimSet,
-        dis_from_starter_of_road: float = ROAD_LENGTH / 2,
+        dis_from_starter_of_road: float = None,
+        random_stream: random.Random = None,
     ):
         # 注意,不能用status,status salabim.Component 是保留字
         self.gate_status = Gate.Status.CLOSED
         self.toll_type = toll_type
-        self.dis = dis_from_starter_of_road
+        self.dis = (
+            ROAD_LENGTH / 2
+            if dis_from_starter_of_road is None
+            else dis_from_starter_of_road
+        )
         # 如何解决共享?可以定义一个新的类,传入这个类的同一个实例
         self.x = x_pos
         self.claim_set = claim_set
+        self.random_stream = random_stream
         self.vehicle_waiting = None
+        self.start_move = self.env.now()
 
+        half_length = self.GATE_LENGTH / 2
+        y = self.dis
+        self.gate_an = None
+        self.etc_sensor_an = None
+        if self.toll_type == Gate.Type.ETC:
+            self.etc_detect_area_claim = Claim(
+                y_lower=(y - half_length - self.ETC_DISTANCE),
+                y_upper=y + half_length,
+                claim_set=self.claim_set,
+                component=self,
+                claim_type=Claim.Type.ETC,
+            )
+            self.claim_set.zones.append(self.etc_detect_area_claim)
+            self.claim_set.sensors.append(self.etc_detect_area_claim)
+            self.vehicles_detected = 0
+        self.gate_claim = Claim(
+            y_lower=y - half_length,
+            y_upper=y + half_length,
+            claim_set=self.claim_set,
+            component=self,
+            claim_type=(
+                Claim.Type.ETC_GATE
+                if self.toll_type == Gate.Type.ETC
+                else Claim.Type.GATE
+            ),
+        )
+        self.gate_claim.set()
+        self.claim_set.gates.append(self.gate_claim)
+        if self.toll_type == Gate.Type.MANUAL:
+            self.claim_set.zones.append(self.gate_claim)
+
+    def attach_animation(self) -> None:
+        if not ENABLE_2D or self.gate_an is not None:
+            return
         half_width = self.__GATE_WIDTH / 2
-        half_length = self.__GATE_LENGTH / 2
+        half_length = self.GATE_LENGTH / 2
         x = self.x
         v = self._MOVE_SPEED
         w = self.__GATE_WIDTH
@@ -197,98 +1241,155 @@ class Gate(sim.Component):
             ),
             fillcolor="white",
         )
-        self.gate_an.start_move = self.env.now()
-        self.gate_an.gate_status = Gate.Status.CLOSED
+        self.gate_an.start_move = self.start_move
+        self.gate_an.gate_status = self.gate_status
         etc_w = self.__ETC_SENSOR_WIDTH
         if self.toll_type == Gate.Type.ETC:
             self.etc_sensor_an = sim.AnimateRectangle(
                 x=x + half_width,
-                y=y - self.__ETC_DISTANCE,
+                y=y - self.ETC_DISTANCE,
                 spec=(0, -etc_w / 2, etc_w, etc_w / 2),
                 fillcolor="green",
             )
-            self.etc_detect_area_claim = Claim(
-                y_lower=(y - half_length - self.__ETC_DISTANCE),
-                y_upper=y + half_length,
-                claim_set=self.claim_set,
-                component=self,
-                claim_type=Claim.Type.ETC,
-            )
-        self.gate_claim = Claim(
-            y_lower=y - half_length,
-            y_upper=y + half_length,
-            claim_set=self.claim_set,
-            component=self,
-            claim_type=(
-                Claim.Type.ETC_GATE
-                if self.toll_type == Gate.Type.ETC
-                else Claim.Type.GATE
-            ),
-        )
+
+    def detach_animation(self) -> None:
+        if self.gate_an is not None:
+            self.gate_an.remove()
+            self.gate_an = None
+        if self.etc_sensor_an is not None:
+            self.etc_sensor_an.remove()
+            self.etc_sensor_an = None
+
+    def blocks(self, vehicle: Vehicle) -> bool:
+        """
+        whether the gate is an obstacle for vehicle
+        """
+        return self.gate_claim.is_set
+
+    def _block_road(self) -> None:
         self.gate_claim.set()
+        self._wake_vehicle_behind()
+
+    def _release_road(self) -> None:
+        self._wake_vehicle_behind()
+        self.gate_claim.reset()
+
+    def _wake_vehicle_behind(self) -> None:
+        # 连续运动的车辆不会逐米检查闸门,闸门占用道路或让出道路时唤醒后面的车重新计算
+        if MOVEMENT_MODE is not MovementMode.CONTINUOUS:
+            return
+        behind = self.gate_claim.get_claim_behind()
+        if (
+            behind is not None
+            and behind.type == Claim.Type.VEHICLE
+            and not behind.component.paying
+        ):
+            behind.component.activate()
 
     def _set_moving_status(self, status: Gate.Status):
         self.gate_status = status
-        self.gate_an.gate_status = status
-        self.gate_an.start_move = self.env.now()
+        self.start_move = self.env.now()
+        if self.gate_an is not None:
+            self.gate_an.gate_status = status
+            self.gate_an.start_move = self.start_move
         self.hold(self._MOVE_TIME)
 
     def _set_motionless_status(self, status: Gate.Status):
         self.gate_status = status
-        self.gate_an.gate_status = status
+        if self.gate_an is not None:
+            self.gate_an.gate_status = status
+        # 等在闸门前的车辆需要重新判断闸门状态
+        self.claim_set.notify(self.gate_claim.yl, self.gate_claim.yu)
 
 
 class EtcGate(Gate):
+    def vehicle_entered(self) -> None:
+        self.vehicles_detected += 1
+        if self.ispassive():
+            self.activate()
+
+    def vehicle_left(self) -> None:
+        self.vehicles_detected -= 1
+        if self.vehicles_detected == 0 and self.ispassive():
+            self.activate()
 
     def process(self):
         while True:
-            while not self.etc_detect_area_claim.overlaps(
-                self.claim_set.claims - {self.gate_claim}
-            ):
-                self.standby()
+            # 车辆进出检测区域时会唤醒闸门
+            while self.vehicles_detected == 0:
+                self.passivate()
             self._set_moving_status(Gate.Status.OPENING)
             self._set_motionless_status(Gate.Status.OPEN)
-            self.gate_claim.reset()
+            self._release_road()
             # 实现一杆抬起多车通行
-            while self.etc_detect_area_claim.overlaps(
-                self.claim_set.claims - {self.gate_claim}
-            ):
-                self.standby()
-            self.gate_claim.set()
+            while self.vehicles_detected > 0:
+                self.passivate()
+            self._block_road()
             self._set_moving_status(Gate.Status.CLOSING)
             self._set_motionless_status(Gate.Status.CLOSED)
 
 
 class ManualGate(Gate):
+    """
+    manual booth: a vehicle stopped at the barrier requests the booth, a
+    sim.Resource of capacity 1, pays for service_time and is let through on
+    its own. The booth is released when the barrier is down again, so the
+    next vehicle is served on the next opening
+    """
+
+    def setup(self, **kwargs):
+        super().setup(**kwargs)
+        self.booth = sim.Resource(f"booth {self.x}")
+        self.service_time = service_time_distribution(self.random_stream)
+        self.vehicle_passing: Optional[Vehicle] = None
+
+    def blocks(self, vehicle: Vehicle) -> bool:
+        # 一车一杆,闸门抬起时也只放行交过费的车辆
+        return self.gate_claim.is_set or self.vehicle_passing is not vehicle
+
     def process(self):
-        if self.toll_type == Gate.Type.MANUAL:
-            self.passivate()
         while True:
+            while self.vehicle_waiting is None:
+                self.passivate()
+            vehicle = self.vehicle_passing = self.vehicle_waiting
+            self.vehicle_waiting = None
             self._set_moving_status(Gate.Status.OPENING)
             self._set_motionless_status(Gate.Status.OPEN)
-            self.gate_claim.reset()
-            # vehicle = self.gate_claim.get_vehicle_next_to_behind()
+            self._release_road()
             # 注意,activate别人不会让自己退出执行,需要standby或passivate
-            self.vehicle_waiting.activate()
-            self.standby()
-            # todo 需要解决多个车紧挨着过去,人工窗口应该是一车一杆
-            while self.gate_claim.overlaps():
-                self.standby()
-            self.gate_claim.set()
+            vehicle.activate()
+            # 连续运动的车辆是逐渐驶入闸门的,所以要等这辆车完全通过
+            while not vehicle.has_passed(self.gate_claim):
+                self.gate_claim.wait()
+            self.vehicle_passing = None
+            self._block_road()
             self._set_moving_status(Gate.Status.CLOSING)
             self._set_motionless_status(Gate.Status.CLOSED)
-            self.passivate()
+            vehicle.release(self.booth)
 
 
 GATE_TYPE_2_SUBCLASS = {Gate.Type.ETC: EtcGate, Gate.Type.MANUAL: ManualGate}
 
 
 class VehicleGenerator(sim.Component):
-    __SLOWEST_V = 5
-    __FASTEST_V = 5
+    SLOWEST_V = 5
+    FASTEST_V = 5
 
-    def setup(self, x_pos: float, vehicle_color: str, claim_set: ClaimSet):
+    def setup(
+        self,
+        x_pos: float,
+        vehicle_color: str,
+        claim_set: ClaimSet,
+        random_stream: random.Random = None,
+    ):
         self.cstr = vehicle_color
+        self.random_stream = random_stream
+        # 到达间隔,见 EXPONENTIAL_ARRIVALS
+        self.interarrival = (
+            sim.Exponential(ARRIVAL_INTERVAL, randomstream=random_stream)
+            if EXPONENTIAL_ARRIVALS
+            else ARRIVAL_INTERVAL
+        )
         self.x = x_pos
         self.claim_set = claim_set
         self.claim = Claim(
@@ -302,16 +1403,17 @@ class VehicleGenerator(sim.Component):
     def process(self):
         while True:
             while self.claim.overlaps():
-                self.hold(sim.Exponential(100))
-            v = sim.Uniform(self.__SLOWEST_V, self.__FASTEST_V)()
-            Vehicle(
+                self.hold(sim.Exponential(100, randomstream=self.random_stream))
+            v = sim.Uniform(
+                self.SLOWEST_V, self.FASTEST_V, randomstream=self.random_stream
+            )()
+            Vehicle.arrive(
                 velocity=v,
                 x_pos=self.x,
                 claim_set=self.claim_set,
                 vehicle_color=self.cstr,
             )
-            # self.hold(sim.Exponential(10))
-            self.hold(10)
+            self.hold(self.interarrival)
 
 
 class Vehicle(sim.Component):
@@ -322,10 +1424,49 @@ class Vehicle(sim.Component):
     __BOUNDARY_LENGTH = LENGTH + 1
     __BOUNDARY_WIDTH = __WIDTH + 0.5
 
+    # 复用的车辆保留自己的claim
+    claim: Optional[Claim] = None
+    next_claim: Optional[Claim] = None
+
+    @classmethod
+    def arrive(cls, claim_set: ClaimSet, **kwargs) -> Vehicle:
+        """
+        a new vehicle on claim_set, a pooled vehicle of the lane is recycled if
+        there is one, see POOL_VEHICLES
+        """
+        if claim_set.vehicle_pool:
+            vehicle = claim_set.vehicle_pool.pop()
+            vehicle.recycle(claim_set=claim_set, **kwargs)
+            return vehicle
+        return cls(claim_set=claim_set, **kwargs)
+
+    def recycle(self, **kwargs) -> None:
+        """
+        restart a vehicle whose process has ended as a new vehicle, with a new
+        name and sequence number and empty status and mode monitors
+        """
+        self.renew()
+        self.setup(**kwargs)
+        self.activate()
+
     def setup(
-        self, velocity: float, x_pos: float, claim_set: ClaimSet, vehicle_color: str
+        self,
+        velocity: float,
+        x_pos: float,
+        claim_set: ClaimSet,
+        vehicle_color: str,
+        length_passed: float = 0,
+        vehicle_class: int = 0,
+        etc: bool = None,
     ):
-        self.length_passed = 0
+        """
+        :param vehicle_class: vehicle class of a toll record
+        :param etc: whether the vehicle pays by ETC, None if unknown
+        """
+        self.length_passed = length_passed
+        self.vehicle_class = vehicle_class
+        self.etc = etc
+        self.start = length_passed
         self.length_to_end = ROAD_LENGTH
         self.v = velocity
         self.x = x_pos
@@ -334,27 +1475,77 @@ class Vehicle(sim.Component):
         now = self.env.now()
         self.last_sampled_time = now
         self.next_sampled_time = now
-        self.claim = None
+        self.last_step = STEP_LENGTH
+        self.enter_time = now
+        # 车辆所在的ETC检测区域
+        self.sensed: list[Claim] = []
+        # 在人工收费亭排队、交费或等待抬杆,此时不能被前车唤醒
+        self.paying = False
+        # 同一车道的前车和后车,由ClaimSet维护
+        self.leader: Optional[Vehicle] = None
+        self.follower: Optional[Vehicle] = None
+        # 最近一次记录的速度和停车时刻,见 __record()
+        self.recorded_v: Optional[float] = None
+        self.stopped_time = now
+        self.wait = 0.0
+        # 动画对象只在车辆可见时存在,见 Viewport
+        self.animation_objects: list = []
+        # 所在路段由 DensityStrip 画成色带时不画车辆本身
+        self.lod_hidden = False
+        self.box3d = None
 
     def process(self):
-        self.claim = self.__claim(self.length_passed)
+        self.__place_claim()
         self.claim.set()
+        self.claim_set.enter(self)
+        self.__sense()
+        self.__record(self.length_passed, self.v)
+        if VIEWPORT is None:
+            self.attach_animation()
+        elif VIEWPORT.contains(self):
+            VIEWPORT.attach(self)
+        if MOVEMENT_MODE is MovementMode.CONTINUOUS:
+            self.__drive()
+            self.__wake_follower()
+        else:
+            self.__step()
+        self.claim_set.leave(self)
+        self.claim.reset()
+        self.__sense()
+        self.__record(self.length_to_end, 0)
+        time_in_system = self.env.now() - self.enter_time
+        self.claim_set.time_in_system.tally(time_in_system)
+        self.claim_set.waiting_time.tally(
+            time_in_system - (self.length_to_end - self.start) / self.v
+        )
+        if VIEWPORT is None:
+            self.detach_animation()
+        else:
+            VIEWPORT.detach(self)
+        if POOL_VEHICLES:
+            self.claim_set.vehicle_pool.append(self)
+
+    def attach_animation(self) -> None:
+        if self.animation_objects:
+            return
         if ENABLE_2D:
-            an_vehicle = sim.AnimateRectangle(
-                x=self.__time_2_x,
-                y=self.__time_2_y,
-                spec=(
-                    -self.__WIDTH / 2,
-                    -self.LENGTH / 2,
-                    self.__WIDTH / 2,
-                    self.LENGTH / 2,
-                ),
-                linecolor=self.__BORDER_COLOR,
-                linewidth=self.__BORDER_WIDTH,
-                fillcolor=self.cstr,
+            self.animation_objects.append(
+                sim.AnimateRectangle(
+                    x=self.__time_2_x,
+                    y=self.__time_2_y,
+                    spec=(
+                        -self.__WIDTH / 2,
+                        -self.LENGTH / 2,
+                        self.__WIDTH / 2,
+                        self.LENGTH / 2,
+                    ),
+                    linecolor=self.__BORDER_COLOR,
+                    linewidth=self.__BORDER_WIDTH,
+                    fillcolor=self.cstr,
+                )
             )
         if ENABLE_3D:
-            an_3d = sim.Animate3dBox(
+            self.box3d = sim.Animate3dBox(
                 x=self.__time_2_x,
                 y=self.__time_2_y,
                 z=0.5,
@@ -364,36 +1555,271 @@ class Vehicle(sim.Component):
                 color=self.cstr,
                 shaded=True,
             )
+            if self.lod_hidden:
+                self.box3d.remove()
+            self.animation_objects.append(self.box3d)
+
+    def detach_animation(self) -> None:
+        for animation_object in self.animation_objects:
+            animation_object.remove()
+        self.animation_objects.clear()
+        self.box3d = None
+
+    def set_lod_hidden(self, hidden: bool) -> None:
+        """
+        hide or show the 3D box, a hidden box is taken out of the animation
+        objects, so frames do not evaluate it at all, see LaneDensity
+        """
+        if hidden == self.lod_hidden:
+            return
+        self.lod_hidden = hidden
+        if self.box3d is not None:
+            if hidden:
+                self.box3d.remove()
+            else:
+                self.box3d.show()
+
+    def __place_claim(self) -> None:
+        """
+        put the claim at the start position, a recycled vehicle moves the claim
+        of its previous trip
+        """
+        y = self.length_passed
+        half_length = self.LENGTH / 2
+        continuous = MOVEMENT_MODE is MovementMode.CONTINUOUS
+        claim = self.claim
+        if (
+            claim is None
+            or claim.claim_set is not self.claim_set
+            or isinstance(claim, MovingClaim) is not continuous
+        ):
+            self.claim = self.__moving_claim(y) if continuous else self.__claim(y)
+        elif continuous:
+            claim.move(y - half_length, y + half_length, 0)
+        else:
+            claim.move_to(y - half_length, y + half_length)
+
+    def __step(self):
+        half_length = self.LENGTH / 2
+        # 下一步要占用的区域,只用于检查和等待,不加入ClaimSet
+        next_claim = self.next_claim
+        if next_claim is None or next_claim.claim_set is not self.claim_set:
+            next_claim = self.next_claim = self.__claim(self.length_passed)
+        adaptive = MOVEMENT_MODE is MovementMode.ADAPTIVE
         while self.length_passed < self.length_to_end:
-            self.next_claim = self.__claim(self.length_passed + STEP_LENGTH)
-
-            while self.next_claim.overlaps(self.claim.claim_set.claims - {self.claim}):
-                overlapped_gate = self.next_claim.get_gate_next_to()
-                if (
-                    overlapped_gate is not None
-                    and overlapped_gate.component.gate_status == Gate.Status.CLOSED
-                ):
-                    overlapped_gate.component.vehicle_waiting = self
-                    overlapped_gate.component.activate()
-                    # todo 记得文档中提到过一种不可打断的队列
-                    self.passivate()
-                    break
-                self.standby()
-            self.claim.reset()
-            self.next_claim.set()
-            self.claim = self.next_claim
-            self.next_claim = None
-            t = STEP_LENGTH / self.v
+            step = STEP_LENGTH
+            if adaptive:
+                step *= self.__free_steps()
+            y = self.length_passed + step
+            next_claim.move_to(y - half_length, y + half_length)
+
+            if (blocking := self.__blocking(next_claim)) is not None:
+                self.__record(self.length_passed, 0)
+                while blocking is not None:
+                    if blocking.type == Claim.Type.GATE:
+                        self.__pay(blocking.component)
+                        break
+                    next_claim.wait()
+                    blocking = self.__blocking(next_claim)
+                self.__record(self.length_passed, self.v)
+            self.claim.move_to(next_claim.yl, next_claim.yu)
+            self.__sense()
+            t = step / self.v
             now = self.env.now()
             self.last_sampled_time = now
             self.next_sampled_time = now + t
-            self.length_passed += STEP_LENGTH
+            self.last_step = step
+            self.length_passed += step
             self.hold(t)
-        self.claim.reset()
-        if ENABLE_2D:
-            an_vehicle.remove()
-        if ENABLE_3D:
-            an_3d.remove()
+
+    def __free_steps(self) -> int:
+        """
+        number of steps of STEP_LENGTH that can be taken at once: up to the
+        leader, the next gate or zone and the end of the road. Inside a gate or
+        zone it is 1, so sensors and gates see the same positions and times as
+        with single steps
+        """
+        claim = self.claim
+        free = self.length_to_end - self.length_passed
+        if self.leader is not None:
+            free = min(free, self.leader.claim.yl - claim.yu)
+        for zones in (self.claim_set.zones, self.claim_set.gates):
+            for zone in zones:
+                if claim.yu <= zone.yl:
+                    free = min(free, zone.yl - claim.yu)
+                elif claim.yl < zone.yu:
+                    return 1
+        return max(1, math.floor(free / STEP_LENGTH + _EPSILON))
+
+    def __drive(self):
+        """
+        drive at constant velocity to the next conflict and hold only once for
+        the whole distance, the followers are woken whenever the velocity
+        changes so they can plan again
+        """
+        half_length = self.LENGTH / 2
+        y = self.length_passed
+        while y < self.length_to_end:
+            target = self.length_to_end
+            for zone in self.claim_set.zones:
+                target = min(target, self.__next_zone_boundary(y, zone))
+            grid = self.claim_set.grid
+            if grid is not None:
+                # 网格上登记到下一个事件为止扫过的区域,每次最多一个单元长度
+                target = min(target, y + grid.cell_length)
+            v = self.v
+            ahead = None
+            # 跟随前车时也不能驶入不放行的闸门
+            for obstacle in self.__obstacles_ahead(y + half_length):
+                if obstacle.v >= v:
+                    continue
+                gap = obstacle.yl - (y + half_length)
+                if gap > _EPSILON:
+                    # 追上前车或到达闸门的位置
+                    target = min(target, y + gap * v / (v - obstacle.v))
+                else:
+                    v = obstacle.v
+                    ahead = obstacle
+            t_end = self.env.now() + (target - y) / v if v else self.env.now()
+            self.__set_velocity(y, v, t_end)
+            if v == 0:
+                self.__wait_for(ahead)
+                continue
+            self.hold(till=t_end)
+            if self.env.now() >= t_end:
+                y = target
+            else:
+                # 被前车或闸门提前唤醒
+                y = self.claim.yl + half_length
+
+    def __blocking(self, claim: Claim) -> Optional[Claim]:
+        """
+        claim of the leader or of a closed gate overlapping claim
+        """
+        if self.leader is not None:
+            leader_claim = self.leader.claim
+            if leader_claim.yl < claim.yu and leader_claim.yu > claim.yl:
+                return leader_claim
+        for gate_claim in self.claim_set.gates:
+            if (
+                gate_claim.yl < claim.yu
+                and gate_claim.yu > claim.yl
+                and gate_claim.component.blocks(self)
+            ):
+                return gate_claim
+        return None
+
+    def __obstacles_ahead(self, y_upper: float) -> list[Claim]:
+        """
+        the leader's claim and the nearest gate blocking this vehicle that
+        starts at or after y_upper
+        """
+        obstacles = [self.leader.claim] if self.leader is not None else []
+        gate = None
+        for gate_claim in self.claim_set.gates:
+            if (
+                gate_claim.yl > y_upper - _EPSILON
+                and (gate is None or gate_claim.yl < gate.yl)
+                and gate_claim.component.blocks(self)
+            ):
+                gate = gate_claim
+        if gate is not None:
+            obstacles.append(gate)
+        return obstacles
+
+    def __set_velocity(self, y: float, v: float, until: float = None) -> None:
+        changed = v != self.claim.v
+        self.claim.move(y - self.LENGTH / 2, y + self.LENGTH / 2, v, until)
+        self.length_passed = y
+        self.last_sampled_time = self.env.now()
+        self.__sense()
+        self.__record(y, v)
+        if changed:
+            self.__wake_follower()
+
+    def __record(self, y: float, v: float) -> None:
+        """
+        hand a row to RECORDER if the velocity changed since the last one
+        """
+        if RECORDER is None or v == self.recorded_v:
+            return
+        now = self.env.now()
+        if v == 0:
+            self.stopped_time = now
+        elif self.recorded_v == 0:
+            self.wait += now - self.stopped_time
+        self.recorded_v = v
+        RECORDER.record(now, self.sequence_number(), self.x, y, v, self.wait)
+
+    def __sense(self) -> None:
+        """
+        notify the gates of the ETC detection areas the claim entered or left,
+        a reset claim has left all of them
+        """
+        claim = self.claim
+        for sensor in self.claim_set.sensors:
+            inside = claim.is_set and claim.yl < sensor.yu and claim.yu > sensor.yl
+            if inside is (sensor in self.sensed):
+                continue
+            if inside:
+                self.sensed.append(sensor)
+                sensor.component.vehicle_entered()
+            else:
+                self.sensed.remove(sensor)
+                sensor.component.vehicle_left()
+
+    def __pay(self, gate: ManualGate) -> None:
+        """
+        queue for the booth of gate, pay and return when the barrier is up
+        """
+        self.paying = True
+        self.request(gate.booth)
+        if gate.service_time is not None:
+            self.hold(gate.service_time)
+        gate.vehicle_waiting = self
+        gate.activate()
+        self.passivate()
+        self.paying = False
+
+    def __wait_for(self, ahead: Claim) -> None:
+        if ahead.type == Claim.Type.GATE:
+            self.__pay(ahead.component)
+        elif ahead.type == Claim.Type.VEHICLE:
+            # 前车速度变化时会唤醒
+            self.passivate()
+        else:
+            # 等待闸门让出道路
+            self.__claim(self.length_passed + STEP_LENGTH).wait()
+
+    def __wake_follower(self) -> None:
+        if self.follower is not None and not self.follower.paying:
+            self.follower.activate()
+
+    def __next_zone_boundary(self, y: float, zone: Claim) -> float:
+        """
+        first position after y on the STEP_LENGTH grid where the vehicle starts
+        or stops overlapping zone, i.e. where the step mode would detect it
+        """
+        half_length = self.LENGTH / 2
+        enter = (math.floor((zone.yl - half_length) / STEP_LENGTH) + 1) * STEP_LENGTH
+        if enter > y:
+            return enter
+        leave = math.ceil((zone.yu + half_length) / STEP_LENGTH) * STEP_LENGTH
+        if zone.type is Claim.Type.GATE or zone.type is Claim.Type.GENERATOR:
+            # 闸门和车辆生成器在车辆开始驶向该位置的那一步就看到车辆通过,
+            # 见 has_passed()
+            leave -= STEP_LENGTH
+        return leave if leave > y else math.inf
+
+    def has_passed(self, claim: Claim) -> bool:
+        """
+        whether the vehicle has left claim behind, as the step mode sees it:
+        a stepping vehicle claims its next step when it starts it, so in
+        continuous movement a moving claim counts as one STEP_LENGTH further
+        """
+        moving = MOVEMENT_MODE is MovementMode.CONTINUOUS and self.claim.v > 0
+        ahead = STEP_LENGTH if moving else 0
+        return self.claim.yl + ahead >= claim.yu - _EPSILON
 
     def __claim(self, length_passed) -> Claim:
         return Claim(
@@ -404,6 +1830,15 @@ class Vehicle(sim.Component):
             claim_type=Claim.Type.VEHICLE,
         )
 
+    def __moving_claim(self, length_passed) -> MovingClaim:
+        return MovingClaim(
+            y_lower=length_passed - self.LENGTH / 2,
+            y_upper=length_passed + self.LENGTH / 2,
+            claim_set=self.claim_set,
+            component=self,
+            claim_type=Claim.Type.VEHICLE,
+        )
+
     def __time_2_x(self, t: float) -> float:
         return self.x
 
@@ -411,17 +1846,28 @@ class Vehicle(sim.Component):
         return self.__time_2_length(t)
 
     def __time_2_length(self, t: float) -> float:
+        if MOVEMENT_MODE is MovementMode.CONTINUOUS:
+            return self.length_passed + self.claim.v * (t - self.last_sampled_time)
         return sim.interpolate(
             t,
             self.last_sampled_time,
             self.next_sampled_time,
-            self.length_passed - STEP_LENGTH,
+            self.length_passed - self.last_step,
             self.length_passed,
         )
 
 
 if __name__ == "__main__":
+    if "--headless" in sys.argv:
+        set_headless()
     env = sim.Environment()
+    if "--accounting" in sys.argv:
+        env.accounting(True, report_at_end=True)
+    if HEADLESS:
+        roads = create_roads()
+        env.run(till=1000)
+        print(statistics(roads))
+        sys.exit()
 
     # 界面左上角在显示器中的位置, 原点为屏幕左上角, x朝右y朝下
     if ENABLE_3D:
@@ -439,34 +1885,15 @@ if __name__ == "__main__":
     env.y0(0)
     env.x1(VIEWPORT_LENGTH)
 
-    for i in range(ROAD_NUM):
-        x_pos = ROAD_X_OFFSET + i * ROAD_INTERVAL
-        toll_type = Gate.Type.MANUAL if i % 2 == 0 else Gate.Type.ETC
-        vehicle_color = VEHICLE_COLOR
-        road_color = ROAD_COLOR
-        show_claims = SHOW_CLAIMS
-        claim_set = ClaimSet(x_pos, show_claims)
-        half_width = ROAD_WIDTH / 2
-        x0 = x_pos - half_width
-        y0 = 0
-        x1 = x_pos + half_width
-        y1 = ROAD_LENGTH
-        if ENABLE_2D:
-            sim.AnimateRectangle(
-                spec=(x0, y0, x1, y1),
-                fillcolor=ROAD_COLOR,
-            )
-        if ENABLE_3D:
-            sim.Animate3dRectangle(x0=x0, y0=y0, x1=x1, y1=y1, color=ROAD_COLOR)
-        GATE_TYPE_2_SUBCLASS[toll_type](
-            toll_type=toll_type, x_pos=x_pos, claim_set=claim_set
-        )
-        VehicleGenerator(
-            x_pos=x_pos,
-            vehicle_color=vehicle_color,
-            claim_set=claim_set,
-        )
+    if "--viewport" in sys.argv:
+        # --viewport x0,y0,x1,y1 只动画框选的区域
+        region = sys.argv[sys.argv.index("--viewport") + 1].split(",")
+        x0, y0, x1, y1 = map(float, region)
+        VIEWPORT = Viewport(x0=x0, y0=y0, x1=x1, y1=y1)
+
+    create_roads()
 
+    sim.Enable_level_of_detail = LEVEL_OF_DETAIL
     env.speed(SIMULATE_SPEED)
     env.background_color("black")
     env.view(
@@ -0,0 +1,334 @@
+"""
+vectorized engine for the toll station model
+
+instead of one sim.Component per vehicle, all vehicles of all lanes are kept
+in NumPy arrays (position, velocity, lane, state and entry time) and advance
+together in time steps of STEP_LENGTH / fastest velocity. Gates are state
+machines over arrays of lanes. The rules are those of the step mode of
+tollstation.py, so statistics() matches tollstation.statistics() for the same
+configuration
+
+a manual lane serves one vehicle at a time: the vehicle stopped at the closed
+barrier pays for MANUAL_SERVICE_TIME, counted down in time steps, then the
+barrier opens for it. A distribution is drawn once per vehicle from its own
+random stream, like in tollstation.py
+"""
+
+from __future__ import annotations
+
+import random
+from typing import Sequence
+
+import numpy as np
+
+import tollstation as ts
+
+
+class VectorizedModel:
+    # vehicle state
+    DRIVING = 0
+    WAITING = 1
+    LEFT = 2
+
+    # gate status, same order as tollstation.Gate.Status
+    CLOSED = 0
+    OPENING = 1
+    OPEN = 2
+    CLOSING = 3
+
+    def __init__(self, toll_types: Sequence[ts.Gate.Type], seed: int = 0):
+        """
+        :param toll_types: gate type of every lane
+        :param seed: seed of the random generator, runs with the same seed
+            give the same statistics
+        """
+        self.rng = np.random.default_rng(seed)
+        lane_num = len(toll_types)
+        self.lane_num = lane_num
+        self.step = ts.STEP_LENGTH
+        self.dt = ts.STEP_LENGTH / ts.VehicleGenerator.FASTEST_V
+        self.tick = 0
+        half_vehicle = ts.Vehicle.LENGTH / 2
+        self.half_vehicle = half_vehicle
+
+        gate_y = ts.ROAD_LENGTH / 2
+        half_gate = ts.Gate.GATE_LENGTH / 2
+        self.gate_lower = gate_y - half_gate
+        self.gate_upper = gate_y + half_gate
+        self.etc_lower = self.gate_lower - ts.Gate.ETC_DISTANCE
+        self.is_etc = np.array([t == ts.Gate.Type.ETC for t in toll_types])
+        self.gate_status = np.full(lane_num, self.CLOSED, dtype=np.int8)
+        self.gate_end = np.zeros(lane_num, dtype=np.int64)
+        # 人工车道当前放行的车辆
+        self.released = np.full(lane_num, -1, dtype=np.int64)
+        self.move_ticks = self._ticks(ts.Gate._MOVE_TIME)
+        self.service_time = ts.service_time_distribution(random.Random(seed))
+        # 人工车道交费结束的时间步,-1 表示没有车辆在交费
+        self.service_end = np.full(lane_num, -1, dtype=np.int64)
+
+        self.next_spawn = np.zeros(lane_num, dtype=np.int64)
+        self.arrival_ticks = self._ticks(ts.ARRIVAL_INTERVAL)
+
+        capacity = 1024
+        self.n = 0
+        self.pos = np.zeros(capacity)
+        self.v = np.zeros(capacity)
+        self.credit = np.zeros(capacity)
+        self.lane = np.zeros(capacity, dtype=np.int32)
+        self.state = np.full(capacity, self.LEFT, dtype=np.int8)
+        self.entry = np.zeros(capacity)
+
+        self.exit_time_in_system: list[np.ndarray] = []
+        self.exit_velocity: list[np.ndarray] = []
+        self.vehicle_time = 0.0
+
+    def _ticks(self, duration: float) -> int:
+        return max(1, int(round(duration / self.dt)))
+
+    def _service_ticks(self, n: int) -> np.ndarray:
+        """
+        service times of n vehicles in time steps, 0 without service time
+        """
+        service_time = self.service_time
+        if service_time is None:
+            return np.zeros(n, dtype=np.int64)
+        if callable(service_time):
+            durations = np.array([service_time() for _ in range(n)], dtype=float)
+        else:
+            durations = np.full(n, float(service_time))
+        return np.maximum(np.rint(durations / self.dt), 0).astype(np.int64)
+
+    def _open(self, lanes: np.ndarray) -> None:
+        self.gate_status[lanes] = self.OPENING
+        self.gate_end[lanes] = self.tick + self.move_ticks
+
+    def _grow(self) -> None:
+        for name in ("pos", "v", "credit", "lane", "entry"):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros_like(array)]))
+        self.state = np.concatenate([self.state, np.full_like(self.state, self.LEFT)])
+
+    def _compact(self) -> None:
+        keep = np.flatnonzero(self.state[: self.n] != self.LEFT)
+        n = len(keep)
+        remap = np.full(self.n, -1, dtype=np.int64)
+        remap[keep] = np.arange(n)
+        for name in ("pos", "v", "credit", "lane", "state", "entry"):
+            array = getattr(self, name)
+            array[:n] = array[keep]
+        self.state[n : self.n] = self.LEFT
+        released = self.released >= 0
+        self.released[released] = remap[self.released[released]]
+        self.n = n
+
+    def _spawn(self) -> None:
+        lanes = np.flatnonzero(self.next_spawn <= self.tick)
+        if len(lanes) == 0:
+            return
+        active = self.state[: self.n] != self.LEFT
+        # 每条车道最后一辆车的位置
+        tail = np.full(self.lane_num, np.inf)
+        np.minimum.at(tail, self.lane[: self.n][active], self.pos[: self.n][active])
+        blocked = tail[lanes] - self.half_vehicle < ts.Vehicle.LENGTH
+        for lane in lanes[blocked]:
+            self.next_spawn[lane] += self._ticks(self.rng.exponential(100))
+        lanes = lanes[~blocked]
+        if ts.EXPONENTIAL_ARRIVALS:
+            interarrival = self.rng.exponential(ts.ARRIVAL_INTERVAL, len(lanes))
+            self.next_spawn[lanes] += np.maximum(
+                1, np.rint(interarrival / self.dt).astype(np.int64)
+            )
+        else:
+            self.next_spawn[lanes] += self.arrival_ticks
+        while self.n + len(lanes) > len(self.pos):
+            self._grow()
+        new = slice(self.n, self.n + len(lanes))
+        self.pos[new] = 0
+        self.v[new] = self.rng.uniform(
+            ts.VehicleGenerator.SLOWEST_V, ts.VehicleGenerator.FASTEST_V, len(lanes)
+        )
+        self.credit[new] = self.step
+        self.lane[new] = lanes
+        self.state[new] = self.DRIVING
+        self.entry[new] = self.tick * self.dt
+        self.n += len(lanes)
+
+    def _move(self) -> None:
+        n = self.n
+        state = self.state[:n]
+        active = np.flatnonzero(state != self.LEFT)
+        credit = self.credit
+        credit[active] = np.minimum(
+            credit[active] + self.v[active] * self.dt, self.step
+        )
+        due = credit[active] >= self.step - ts._EPSILON
+
+        leaving = active[due & (self.pos[active] >= ts.ROAD_LENGTH)]
+        if len(leaving):
+            state[leaving] = self.LEFT
+            self.exit_time_in_system.append(self.tick * self.dt - self.entry[leaving])
+            self.exit_velocity.append(self.v[leaving].copy())
+            active = np.flatnonzero(state != self.LEFT)
+        if len(active) == 0:
+            return
+
+        # 按车道排列,同一车道内先生成的在前
+        order = active[np.lexsort((active, self.lane[active]))]
+        lane = self.lane[order]
+        pos = self.pos[order]
+        has_leader = np.zeros(len(order), dtype=bool)
+        has_leader[1:] = lane[1:] == lane[:-1]
+        leader_pos = np.empty(len(order))
+        leader_pos[1:] = pos[:-1]
+        leader_pos[0] = np.inf
+        leader_pos[~has_leader] = np.inf
+        gap_free = leader_pos - pos - ts.Vehicle.LENGTH >= self.step - ts._EPSILON
+
+        next_lower = pos + self.step - self.half_vehicle
+        next_upper = pos + self.step + self.half_vehicle
+        manual = ~self.is_etc[lane]
+        gate_set = self.gate_status[lane] != self.OPEN
+        # 人工闸门一车一杆,抬杆时也只放行交过费的车辆
+        gate_set |= manual & (order != self.released[lane])
+        gate_block = (
+            gate_set & (next_lower < self.gate_upper) & (next_upper > self.gate_lower)
+        )
+        due = self.credit[order] >= self.step - ts._EPSILON
+
+        # 人工车道:车辆到达关闭且空闲的闸门前开始交费,交完后闸门抬起
+        handshake = due & gate_block & manual
+        handshake &= (self.gate_status[lane] == self.CLOSED) & (
+            self.released[lane] < 0
+        )
+        if handshake.any():
+            lanes, first = np.unique(lane[handshake], return_index=True)
+            self.released[lanes] = order[np.flatnonzero(handshake)[first]]
+            service = self._service_ticks(len(lanes))
+            paid = service == 0
+            self._open(lanes[paid])
+            self.service_end[lanes[~paid]] = self.tick + service[~paid]
+
+        base = due & ~gate_block & gap_free
+        # 紧跟前车的车辆和前车同时前进
+        link = due & ~gate_block & has_leader & ~gap_free
+        index = np.arange(len(order))
+        root = np.maximum.accumulate(np.where(link, 0, index))
+        moves = base[root]
+        moved = order[moves]
+        self.pos[moved] += self.step
+        self.credit[moved] -= self.step
+        state[order] = np.where(moves, self.DRIVING, self.WAITING)
+
+    def _update_gates(self) -> None:
+        expired = self.gate_end <= self.tick
+        opening = expired & (self.gate_status == self.OPENING)
+        closing = expired & (self.gate_status == self.CLOSING)
+        self.gate_status[opening] = self.OPEN
+        self.gate_status[closing] = self.CLOSED
+        paid = (self.service_end >= 0) & (self.service_end <= self.tick)
+        if paid.any():
+            self.service_end[paid] = -1
+            self._open(np.flatnonzero(paid))
+
+    def _sense(self) -> None:
+        n = self.n
+        active = np.flatnonzero(self.state[:n] != self.LEFT)
+        lower = self.pos[active] - self.half_vehicle
+        upper = self.pos[active] + self.half_vehicle
+        lane = self.lane[active]
+        lane_num = self.lane_num
+        in_etc_area = np.bincount(
+            lane[(lower < self.gate_upper) & (upper > self.etc_lower)],
+            minlength=lane_num,
+        ).astype(bool)
+
+        status = self.gate_status
+        opening = self.is_etc & (status == self.CLOSED) & in_etc_area
+        closing = self.is_etc & (status == self.OPEN) & ~in_etc_area
+
+        released = self.released
+        passed = np.ones(lane_num, dtype=bool)
+        waiting = released >= 0
+        passed[waiting] = (self.state[released[waiting]] == self.LEFT) | (
+            self.pos[released[waiting]] - self.half_vehicle >= self.gate_upper
+        )
+        closing |= ~self.is_etc & (status == self.OPEN) & passed
+        released[closing & ~self.is_etc] = -1
+
+        status[opening] = self.OPENING
+        status[closing] = self.CLOSING
+        self.gate_end[opening | closing] = self.tick + self.move_ticks
+
+    def run(self, till: float) -> None:
+        """
+        process all time steps up to and including till, like
+        sim.Environment.run(till=till)
+        """
+        end_tick = int(round(till / self.dt))
+        while self.tick <= end_tick:
+            if self.tick > 0:
+                # 上一个时间步内车道上的车辆数
+                self.vehicle_time += (
+                    np.count_nonzero(self.state[: self.n] != self.LEFT) * self.dt
+                )
+            self._update_gates()
+            self._spawn()
+            self._move()
+            self._sense()
+            self.tick += 1
+            if (
+                self.n > 1024
+                and np.count_nonzero(self.state[: self.n] == self.LEFT) > self.n // 2
+            ):
+                self._compact()
+
+    def statistics(self) -> dict[str, float]:
+        """
+        same keys and meaning as tollstation.statistics()
+        """
+        if self.exit_time_in_system:
+            time_in_system = np.concatenate(self.exit_time_in_system)
+            velocity = np.concatenate(self.exit_velocity)
+        else:
+            time_in_system = velocity = np.zeros(0)
+        passed = len(time_in_system)
+        now = (self.tick - 1) * self.dt
+        if not passed:
+            return {
+                "passed": 0,
+                "time_in_system": 0.0,
+                "waiting_time": 0.0,
+                "vehicles_in_lane": float(self.vehicle_time / now) if now > 0 else 0.0,
+            }
+        return {
+            "passed": passed,
+            "time_in_system": float(time_in_system.mean()),
+            "waiting_time": float((time_in_system - ts.ROAD_LENGTH / velocity).mean()),
+            "vehicles_in_lane": float(self.vehicle_time / now),
+        }
+
+
+def toll_types(road_num: int = None) -> list[ts.Gate.Type]:
+    """
+    same gate mix as tollstation.create_roads()
+    """
+    if road_num is None:
+        road_num = ts.ROAD_NUM
+    return [ts.toll_type_of(i) for i in range(road_num)]
+
+
+if __name__ == "__main__":
+    import time
+
+    till = 3000
+    start = time.perf_counter()
+    model = VectorizedModel(toll_types())
+    model.run(till)
+    print(f"vectorized {time.perf_counter() - start:6.2f}s", model.statistics())
+
+    ts.set_headless()
+    env = ts.sim.Environment()
+    roads = ts.create_roads()
+    start = time.perf_counter()
+    env.run(till)
+    print(f"discrete   {time.perf_counter() - start:6.2f}s", ts.statistics(roads))
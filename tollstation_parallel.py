@@ -0,0 +1,146 @@
+"""
+process-parallel execution of the toll station model
+
+the lanes of tollstation.create_roads() never interact, so they are divided
+over a process pool. Every worker simulates its lanes headless in its own
+sim.Environment, each lane drawing from its own random stream
+(tollstation.lane_random_stream), so the result of a lane does not depend on
+the number of workers. The per-lane monitors are frozen, sent back and merged
+in the parent
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import os
+from typing import Any, NamedTuple, Sequence
+
+import tollstation as ts
+
+sim = ts.sim
+
+
+class LaneMonitors(NamedTuple):
+    lane: int
+    time_in_system: sim.Monitor
+    waiting_time: sim.Monitor
+    vehicles_in_lane: sim.Monitor
+
+
+# 被修改过的 tollstation 常量的原始值,worker 进程会被多个任务复用
+_defaults: dict[str, Any] = {}
+
+
+def apply_settings(settings: dict[str, Any] = None) -> None:
+    """
+    headless configuration of a worker process, settings are tollstation
+    module constants, e.g. {"STEP_LENGTH": 2}, constants changed by an earlier
+    call are restored first
+    """
+    ts.set_headless()
+    for name, value in _defaults.items():
+        setattr(ts, name, value)
+    for name, value in (settings or {}).items():
+        if not hasattr(ts, name):
+            raise AttributeError(f"tollstation has no setting {name}")
+        _defaults.setdefault(name, getattr(ts, name))
+        setattr(ts, name, value)
+
+
+def run_lanes(
+    lanes: Sequence[int],
+    till: float,
+    seed: int,
+    settings: dict[str, Any] = None,
+) -> list[LaneMonitors]:
+    """
+    simulate the given lanes in a new environment, runs in a worker process
+    """
+    apply_settings(settings)
+    env = sim.Environment(random_seed=seed)
+    roads = ts.create_roads(seed=seed, lanes=lanes)
+    env.run(till=till)
+    return [
+        LaneMonitors(
+            lane,
+            road.claim_set.time_in_system.freeze(),
+            road.claim_set.waiting_time.freeze(),
+            road.claim_set.vehicles_in_lane.freeze(),
+        )
+        for lane, road in zip(lanes, roads)
+    ]
+
+
+def partition(lanes: Sequence[int], parts: int) -> list[Sequence[int]]:
+    """
+    consecutive slices of nearly equal size, consecutive lanes have mixed gate
+    types so the work is balanced as well
+    """
+    n = len(lanes)
+    parts = max(1, min(parts, n))
+    return [lanes[i * n // parts : (i + 1) * n // parts] for i in range(parts)]
+
+
+def run_parallel(
+    till: float,
+    road_num: int = None,
+    seed: int = 0,
+    workers: int = None,
+    settings: dict[str, Any] = None,
+) -> list[LaneMonitors]:
+    """
+    simulate road_num lanes (default ROAD_NUM) on a pool of workers processes
+    (default the number of cpus)
+
+    :return: the frozen monitors of every lane, ordered by lane
+    """
+    if road_num is None:
+        road_num = (settings or {}).get("ROAD_NUM", ts.ROAD_NUM)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    chunks = partition(range(road_num), workers)
+    with concurrent.futures.ProcessPoolExecutor(len(chunks)) as executor:
+        futures = [
+            executor.submit(run_lanes, chunk, till, seed, settings) for chunk in chunks
+        ]
+        results = [
+            lane_monitors for future in futures for lane_monitors in future.result()
+        ]
+    return merge_environments(results)
+
+
+def merge_environments(results: list[LaneMonitors]) -> list[LaneMonitors]:
+    """
+    sim.Monitor.merge only merges monitors of one environment, all workers
+    simulated till the same time, so the frozen monitors can share the
+    environment of the first one
+    """
+    env = results[0].time_in_system.env
+    for lane_monitors in results:
+        for monitor in lane_monitors[1:]:
+            monitor.env = env
+    return results
+
+
+def statistics(results: list[LaneMonitors]) -> dict[str, float]:
+    """
+    same keys and meaning as tollstation.statistics()
+    """
+    return ts.monitor_statistics(
+        [result.time_in_system for result in results],
+        [result.waiting_time for result in results],
+        [result.vehicles_in_lane for result in results],
+    )
+
+
+if __name__ == "__main__":
+    import time
+
+    till = 1000
+    for workers in sorted({1, os.cpu_count() or 1}):
+        start = time.perf_counter()
+        results = run_parallel(till, workers=workers)
+        print(
+            f"{workers:3d} workers {time.perf_counter() - start:6.2f}s",
+            statistics(results),
+        )
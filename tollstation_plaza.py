@@ -0,0 +1,176 @@
+"""
+shared plaza approach: arriving vehicles choose their lane
+
+instead of one VehicleGenerator per lane with a fixed arrival interval, a
+single Plaza generates the arrivals of all lanes. ETC_VEHICLE_RATIO of the
+vehicles pay by ETC and may use any lane, the others only manual lanes. Every
+vehicle takes the least loaded lane it may use, the load of a lane is the
+number of vehicles that chose it and have not left the road yet (queued in the
+approach or on the road).
+
+loads are kept in a LoadIndex per gate type, updated when the plaza assigns a
+vehicle and when a vehicle leaves its ClaimSet, so choosing a lane does not
+depend on the number of lanes
+"""
+
+from __future__ import annotations
+
+import random
+from typing import Optional
+
+import tollstation as ts
+from tollstation_trace import TraceVehicleGenerator
+
+sim = ts.sim
+
+ETC_VEHICLE_RATIO = 0.5
+
+
+class LoadIndex:
+    """
+    lanes bucketed on their load, loads change by one at a time so the least
+    loaded bucket is found in O(1) amortized
+
+    lanes of equal load are chosen in the order they reached that load
+    """
+
+    def __init__(self):
+        # buckets[load] 是负载为 load 的车道,dict 当作有序集合使用
+        self.buckets: list[dict[ts.ClaimSet, None]] = [{}]
+        self.loads: dict[ts.ClaimSet, int] = {}
+        self.min_load = 0
+
+    def __len__(self) -> int:
+        return len(self.loads)
+
+    def __contains__(self, lane: ts.ClaimSet) -> bool:
+        return lane in self.loads
+
+    def add(self, lane: ts.ClaimSet) -> None:
+        self.loads[lane] = 0
+        self.buckets[0][lane] = None
+        self.min_load = 0
+
+    def increment(self, lane: ts.ClaimSet) -> None:
+        load = self.loads[lane]
+        buckets = self.buckets
+        del buckets[load][lane]
+        if load + 1 == len(buckets):
+            buckets.append({})
+        buckets[load + 1][lane] = None
+        self.loads[lane] = load + 1
+        if load == self.min_load and not buckets[load]:
+            self.min_load = load + 1
+
+    def decrement(self, lane: ts.ClaimSet) -> None:
+        load = self.loads[lane]
+        del self.buckets[load][lane]
+        self.buckets[load - 1][lane] = None
+        self.loads[lane] = load - 1
+        if load - 1 < self.min_load:
+            self.min_load = load - 1
+
+    def least(self) -> tuple[int, Optional[ts.ClaimSet]]:
+        """
+        :return: the least load and a lane with that load, (0, None) if the
+            index is empty
+        """
+        if not self.loads:
+            return 0, None
+        return self.min_load, next(iter(self.buckets[self.min_load]))
+
+
+class Plaza(sim.Component):
+    """
+    arrivals of all roads, every arrival is handed to the TraceVehicleGenerator
+    of the chosen lane, which queues it until the start of the road is free
+    """
+
+    def setup(
+        self,
+        roads: list[ts.Road],
+        arrival_interval: float = None,
+        etc_vehicle_ratio: float = None,
+        random_stream: random.Random = None,
+    ):
+        """
+        :param arrival_interval: time between arrivals, defaults to
+            ARRIVAL_INTERVAL / number of roads, the same total arrival rate as
+            create_roads()
+        :param etc_vehicle_ratio: defaults to ETC_VEHICLE_RATIO
+        """
+        self.arrival_interval = (
+            ts.ARRIVAL_INTERVAL / len(roads)
+            if arrival_interval is None
+            else arrival_interval
+        )
+        self.etc_vehicle_ratio = (
+            ETC_VEHICLE_RATIO if etc_vehicle_ratio is None else etc_vehicle_ratio
+        )
+        self.uniform = sim.Uniform(0, 1, randomstream=random_stream)
+        self.interarrival = (
+            sim.Exponential(self.arrival_interval, randomstream=random_stream)
+            if ts.EXPONENTIAL_ARRIVALS
+            else self.arrival_interval
+        )
+        self.indexes = {toll_type: LoadIndex() for toll_type in ts.Gate.Type}
+        self.generators: dict[ts.ClaimSet, TraceVehicleGenerator] = {}
+        for road in roads:
+            claim_set = road.claim_set
+            index = self.indexes[road.gate.toll_type]
+            index.add(claim_set)
+            claim_set.load_index = index
+            self.generators[claim_set] = road.vehicle_generator
+        self.arrivals = 0
+
+    def choose(self, etc: bool) -> ts.ClaimSet:
+        """
+        least loaded lane a vehicle may use, ETC lanes win ties for ETC
+        vehicles. Without manual lanes every vehicle uses the ETC lanes
+        """
+        manual_load, manual_lane = self.indexes[ts.Gate.Type.MANUAL].least()
+        etc_load, etc_lane = self.indexes[ts.Gate.Type.ETC].least()
+        if etc_lane is None or (not etc and manual_lane is not None):
+            return manual_lane
+        if manual_lane is None or etc_load <= manual_load:
+            return etc_lane
+        return manual_lane
+
+    def process(self):
+        while True:
+            etc = self.uniform() < self.etc_vehicle_ratio
+            lane = self.choose(etc)
+            lane.load_index.increment(lane)
+            generator = self.generators[lane]
+            generator.backlog.append((0, etc))
+            if generator.ispassive():
+                generator.activate()
+            self.arrivals += 1
+            self.hold(self.interarrival)
+
+
+def create_plaza_roads(
+    road_num: int = None, seed: int = None, arrival_interval: float = None
+) -> tuple[list[ts.Road], Plaza]:
+    """
+    create_roads() whose vehicles arrive at a shared Plaza
+    """
+    roads = ts.create_roads(
+        road_num, seed=seed, vehicle_generator_class=TraceVehicleGenerator
+    )
+    plaza = Plaza(
+        roads=roads,
+        arrival_interval=arrival_interval,
+        random_stream=None if seed is None else random.Random(f"{seed}.plaza"),
+    )
+    return roads, plaza
+
+
+if __name__ == "__main__":
+    import sys
+
+    ts.set_headless()
+    env = sim.Environment()
+    roads, plaza = create_plaza_roads(int(sys.argv[1]) if len(sys.argv) > 1 else None)
+    env.run(till=float(sys.argv[2]) if len(sys.argv) > 2 else 1000)
+    print(f"arrivals {plaza.arrivals}", ts.statistics(roads))
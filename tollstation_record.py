@@ -0,0 +1,209 @@
+"""
+per-vehicle trajectories for offline analysis and replay
+
+tollstation.Vehicle hands a row to tollstation.RECORDER whenever its velocity
+changes: when it enters the road, stops, starts again and leaves. In between
+it moves with constant velocity, so its position at time t is
+y + v * (t - time) of its last row, the last row of a vehicle is where it
+left the road. A row is
+
++ time: simulation time
++ vehicle: sequence number of the vehicle
++ x: mid x-coordinate of the lane
++ y: position of the middle of the vehicle
++ v: velocity from time on
++ wait: total time the vehicle stood still till time
+
+rows are buffered in typed arrays (array.array) and written in bulk every
+CHUNK_ROWS rows, as record batches of an Arrow IPC file if pyarrow is
+installed, otherwise as numbered .npz files in a directory
+"""
+
+from __future__ import annotations
+
+import array
+import os
+from typing import Iterator
+
+import numpy as np
+
+import tollstation as ts
+
+TRAJECTORY_DTYPE = np.dtype(
+    [
+        ("time", "<f8"),
+        ("vehicle", "<i8"),
+        ("x", "<f8"),
+        ("y", "<f8"),
+        ("v", "<f8"),
+        ("wait", "<f8"),
+    ]
+)
+CHUNK_ROWS = 65536
+
+# array.array 的类型码,和 TRAJECTORY_DTYPE 一一对应
+_TYPECODES = {"time": "d", "vehicle": "q", "x": "d", "y": "d", "v": "d", "wait": "d"}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        return None
+    return pyarrow
+
+
+class TrajectoryRecorder:
+    """
+    writes the rows of record() to path, use as context manager or call
+    close() after the run, e.g.
+
+        with TrajectoryRecorder("run.arrow") as ts.RECORDER:
+            env.run(till=3600)
+    """
+
+    def __init__(self, path: str, chunk_rows: int = CHUNK_ROWS, arrow: bool = None):
+        """
+        :param arrow: write Arrow IPC, defaults to whether pyarrow is installed
+        """
+        pyarrow = _pyarrow()
+        if arrow is None:
+            arrow = pyarrow is not None
+        elif arrow and pyarrow is None:
+            raise ImportError("Arrow IPC output requires pyarrow")
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self.chunks = 0
+        self.columns = {
+            name: array.array(typecode) for name, typecode in _TYPECODES.items()
+        }
+        self._appends = tuple(column.append for column in self.columns.values())
+        self._time = self.columns["time"]
+        if arrow:
+            self._pyarrow = pyarrow
+            self._writer = pyarrow.ipc.new_file(
+                path, pyarrow.schema(list(zip(TRAJECTORY_DTYPE.names, _arrow_types())))
+            )
+        else:
+            self._pyarrow = None
+            self._writer = None
+            os.makedirs(path, exist_ok=True)
+
+    def __enter__(self) -> TrajectoryRecorder:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def record(
+        self, time: float, vehicle: int, x: float, y: float, v: float, wait: float
+    ) -> None:
+        append_time, append_vehicle, append_x, append_y, append_v, append_wait = (
+            self._appends
+        )
+        append_time(time)
+        append_vehicle(vehicle)
+        append_x(x)
+        append_y(y)
+        append_v(v)
+        append_wait(wait)
+        if len(self._time) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        write the buffered rows as one chunk
+        """
+        n = len(self._time)
+        if n == 0:
+            return
+        columns = {
+            name: np.frombuffer(column, dtype=TRAJECTORY_DTYPE.fields[name][0])
+            for name, column in self.columns.items()
+        }
+        if self._writer is not None:
+            self._writer.write_batch(
+                self._pyarrow.record_batch(list(columns.values()), names=list(columns))
+            )
+        else:
+            np.savez(os.path.join(self.path, f"chunk-{self.chunks:06d}.npz"), **columns)
+        # np.frombuffer 引用着缓冲区,清空前必须释放
+        del columns
+        for column in self.columns.values():
+            del column[:]
+        self.rows += n
+        self.chunks += 1
+
+    def close(self) -> None:
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def _arrow_types() -> list:
+    pyarrow = _pyarrow()
+    return [
+        pyarrow.int64() if typecode == "q" else pyarrow.float64()
+        for typecode in _TYPECODES.values()
+    ]
+
+
+def read_trajectories(path: str) -> Iterator[np.ndarray]:
+    """
+    chunks of TRAJECTORY_DTYPE records in the order they were written, i.e.
+    ordered on time
+    """
+    if os.path.isdir(path):
+        names = sorted(
+            name
+            for name in os.listdir(path)
+            if name.startswith("chunk-") and name.endswith(".npz")
+        )
+        for name in names:
+            with np.load(os.path.join(path, name)) as columns:
+                chunk = np.empty(len(columns["time"]), dtype=TRAJECTORY_DTYPE)
+                for field in TRAJECTORY_DTYPE.names:
+                    chunk[field] = columns[field]
+            yield chunk
+        return
+    pyarrow = _pyarrow()
+    if pyarrow is None:
+        raise ImportError(f"reading Arrow IPC file {path} requires pyarrow")
+    with pyarrow.ipc.open_file(path) as reader:
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            chunk = np.empty(batch.num_rows, dtype=TRAJECTORY_DTYPE)
+            for field in TRAJECTORY_DTYPE.names:
+                chunk[field] = batch.column(field).to_numpy()
+            yield chunk
+
+
+def load_trajectories(path: str) -> np.ndarray:
+    """
+    all records of path in one array
+    """
+    chunks = list(read_trajectories(path))
+    if not chunks:
+        return np.empty(0, dtype=TRAJECTORY_DTYPE)
+    return np.concatenate(chunks)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    ts.set_headless()
+    env = ts.sim.Environment()
+    roads = ts.create_roads()
+    till = float(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    start = time.perf_counter()
+    with TrajectoryRecorder(sys.argv[1]) as ts.RECORDER:
+        env.run(till=till)
+    print(
+        f"{ts.RECORDER.rows} rows in {ts.RECORDER.chunks} chunks "
+        f"{time.perf_counter() - start:6.2f}s",
+        ts.statistics(roads),
+    )
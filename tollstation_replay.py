@@ -0,0 +1,296 @@
+"""
+replay of recorded trajectories, decoupled from the simulation
+
+run the simulation headless at full speed with a TrajectoryRecorder, then
+replay the file in a viewer that has no environment, components or animation
+objects of its own:
+
+    python tollstation_record.py run.arrow 36000
+    python tollstation_replay.py run.arrow
+
+a row of the recording is valid from its time till the next row of the same
+vehicle, the vehicle is at y + v * (t - time) in between. The last row of a
+vehicle that left the road ends its trajectory. Replay keeps a keyframe every
+KEYFRAME_INTERVAL with the rows valid at that time, so the state at any time
+is one binary search for the keyframe and one for the rows recorded since,
+independent of the length of the run. Scrubbing, pausing and rewinding are
+just queries at another time
+
+ReplayViewer draws the state top down on a tkinter canvas, tkinter is only
+imported when a viewer is created
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Optional
+
+import numpy as np
+
+import tollstation as ts
+from tollstation_record import load_trajectories
+
+KEYFRAME_INTERVAL = 10.0
+# 回放速度,每秒真实时间对应的仿真时间
+REPLAY_SPEED = 10.0
+FRAME_INTERVAL_MS = 20
+STOPPED_COLOR = "red"
+VEHICLE_WIDTH = 2
+SLIDER_RESOLUTION = 0.1
+
+
+class Replay:
+    """
+    time index of recorded trajectories
+    """
+
+    def __init__(
+        self,
+        rows: np.ndarray,
+        road_length: float = None,
+        keyframe_interval: float = KEYFRAME_INTERVAL,
+    ):
+        """
+        :param rows: TRAJECTORY_DTYPE records, see load_trajectories()
+        :param road_length: y where vehicles leave the road, defaults to
+            tollstation.ROAD_LENGTH
+        """
+        if road_length is None:
+            road_length = ts.ROAD_LENGTH
+        rows = rows[np.argsort(rows["time"], kind="stable")]
+        self.rows = rows
+        self.time = np.ascontiguousarray(rows["time"])
+        self.end = self.__row_ends(rows, road_length)
+        n = len(rows)
+        self.start_time = float(self.time[0]) if n else 0.0
+        self.end_time = float(self.time[-1]) if n else 0.0
+        self.keyframe_times = np.arange(
+            self.start_time, self.end_time + keyframe_interval, keyframe_interval
+        )
+        self.keyframe_offsets, self.keyframe_rows = self.__keyframes()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @staticmethod
+    def __row_ends(rows: np.ndarray, road_length: float) -> np.ndarray:
+        """
+        time till which every row is valid: the time of the next row of the
+        vehicle, its own time if it is the row of leaving the road (it is
+        never valid) and inf if the recording ends before the vehicle left
+        """
+        end = np.full(len(rows), np.inf)
+        order = np.argsort(rows["vehicle"], kind="stable")
+        vehicle = rows["vehicle"][order]
+        same = vehicle[1:] == vehicle[:-1]
+        end[order[:-1][same]] = rows["time"][order[1:][same]]
+        last = order[np.append(~same, True)] if len(order) else order
+        left = last[rows["y"][last] >= road_length]
+        end[left] = rows["time"][left]
+        return end
+
+    def __keyframes(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        for every keyframe the rows valid at its time, as offsets into one
+        array of row indices
+        """
+        keyframe_times = self.keyframe_times
+        first = np.searchsorted(keyframe_times, self.time, side="left")
+        stop = np.searchsorted(keyframe_times, self.end, side="left")
+        counts = np.maximum(stop - first, 0)
+        rows = np.repeat(np.arange(len(self.rows)), counts)
+        # 每行覆盖的关键帧是 first 起连续的 counts 个
+        starts = np.cumsum(counts) - counts
+        keyframes = (
+            np.repeat(first, counts) + np.arange(len(rows)) - np.repeat(starts, counts)
+        )
+        order = np.argsort(keyframes, kind="stable")
+        offsets = np.zeros(len(keyframe_times) + 1, dtype=np.int64)
+        counts = np.bincount(keyframes, minlength=len(keyframe_times))
+        np.cumsum(counts, out=offsets[1:])
+        return offsets, rows[order]
+
+    def valid_rows(self, t: float) -> np.ndarray:
+        """
+        indices of the rows valid at t, one for every vehicle on the road
+        """
+        k = int(np.searchsorted(self.keyframe_times, t, side="right")) - 1
+        if k < 0:
+            return np.empty(0, dtype=np.int64)
+        offsets = self.keyframe_offsets
+        since = np.searchsorted(self.time, self.keyframe_times[k], side="right")
+        till = np.searchsorted(self.time, t, side="right")
+        candidates = np.concatenate(
+            (
+                self.keyframe_rows[offsets[k] : offsets[k + 1]],
+                np.arange(since, till),
+            )
+        )
+        return candidates[self.end[candidates] > t]
+
+    def state(self, t: float) -> np.ndarray:
+        """
+        the vehicles on the road at t as TRAJECTORY_DTYPE records, with time t
+        and y the position at t
+        """
+        rows = self.rows[self.valid_rows(t)]
+        rows["y"] += rows["v"] * (t - rows["time"])
+        rows["time"] = t
+        return rows
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> Replay:
+        return cls(load_trajectories(path), **kwargs)
+
+
+class ReplayViewer:
+    """
+    top down view of a Replay, lanes side by side and y upwards
+
+    space pauses and resumes, left and right step one frame, home rewinds,
+    + and - double and halve the speed, r reverses, the slider scrubs
+    """
+
+    def __init__(
+        self,
+        replay: Replay,
+        speed: float = REPLAY_SPEED,
+        width: int = ts.WINDOW_SIZE,
+        height: int = ts.WINDOW_SIZE,
+        road_length: float = None,
+    ):
+        import tkinter
+
+        self.replay = replay
+        self.speed = speed
+        self.t = replay.start_time
+        self.paused = False
+        self.width = width
+        self.height = height
+        road_length = ts.ROAD_LENGTH if road_length is None else road_length
+        lanes = np.unique(replay.rows["x"]) if len(replay) else np.empty(0)
+        x0 = (lanes.min() if len(lanes) else 0) - ts.ROAD_INTERVAL / 2
+        x1 = (lanes.max() if len(lanes) else 0) + ts.ROAD_INTERVAL / 2
+        self.x0 = x0
+        self.x_scale = width / (x1 - x0)
+        self.y_scale = height / road_length
+        self.__last_frame: Optional[float] = None
+
+        self.root = tkinter.Tk()
+        self.root.title("tollstation replay")
+        self.canvas = tkinter.Canvas(
+            self.root, width=width, height=height, background="black"
+        )
+        self.canvas.pack()
+        for x in lanes:
+            self.canvas.create_rectangle(
+                *self.__canvas(x - ts.ROAD_WIDTH / 2, 0),
+                *self.__canvas(x + ts.ROAD_WIDTH / 2, road_length),
+                fill=_tk_color(ts.ROAD_COLOR),
+                width=0,
+            )
+        # 画布上的车辆矩形按需创建,之后只更新坐标和颜色,多余的隐藏
+        self.items: list[int] = []
+        self.label = tkinter.Label(self.root, anchor="w")
+        self.label.pack(fill="x")
+        self.slider = tkinter.Scale(
+            self.root,
+            from_=replay.start_time,
+            to=replay.end_time,
+            orient="horizontal",
+            resolution=SLIDER_RESOLUTION,
+            showvalue=False,
+            command=self.__scrub,
+        )
+        self.slider.pack(fill="x")
+        self.root.bind("<space>", lambda event: self.toggle_pause())
+        self.root.bind("<Left>", lambda event: self.seek(self.t - self.__frame_step()))
+        self.root.bind("<Right>", lambda event: self.seek(self.t + self.__frame_step()))
+        self.root.bind("<Home>", lambda event: self.seek(replay.start_time))
+        self.root.bind("<plus>", lambda event: self.__set_speed(self.speed * 2))
+        self.root.bind("<minus>", lambda event: self.__set_speed(self.speed / 2))
+        self.root.bind("r", lambda event: self.__set_speed(-self.speed))
+
+    def __canvas(self, x: float, y: float) -> tuple[float, float]:
+        return (x - self.x0) * self.x_scale, self.height - y * self.y_scale
+
+    def __frame_step(self) -> float:
+        return abs(self.speed) * FRAME_INTERVAL_MS / 1000
+
+    def __set_speed(self, speed: float) -> None:
+        self.speed = speed
+        self.draw()
+
+    def __scrub(self, value: str) -> None:
+        # slider.set() in __tick() calls back with t rounded to the resolution
+        if abs(float(value) - self.t) > SLIDER_RESOLUTION:
+            self.seek(float(value))
+
+    def toggle_pause(self) -> None:
+        self.paused = not self.paused
+        self.__last_frame = None
+        self.draw()
+
+    def seek(self, t: float) -> None:
+        self.t = min(max(t, self.replay.start_time), self.replay.end_time)
+        self.draw()
+
+    def draw(self) -> None:
+        state = self.replay.state(self.t)
+        canvas = self.canvas
+        items = self.items
+        while len(items) < len(state):
+            items.append(canvas.create_rectangle(0, 0, 0, 0, width=0))
+        half_width = VEHICLE_WIDTH / 2 * self.x_scale
+        half_length = ts.Vehicle.LENGTH / 2 * self.y_scale
+        xs = (state["x"] - self.x0) * self.x_scale
+        ys = self.height - state["y"] * self.y_scale
+        moving = _tk_color(ts.VEHICLE_COLOR)
+        for item, x, y, v in zip(items, xs.tolist(), ys.tolist(), state["v"].tolist()):
+            canvas.coords(
+                item, x - half_width, y - half_length, x + half_width, y + half_length
+            )
+            fill = moving if v else STOPPED_COLOR
+            canvas.itemconfigure(item, state="normal", fill=fill)
+        for item in items[len(state) :]:
+            canvas.itemconfigure(item, state="hidden")
+        self.label.configure(
+            text=f"t={self.t:10.1f}  vehicles={len(state):5d}  speed={self.speed:g}"
+            + ("  paused" if self.paused else "")
+        )
+
+    def __tick(self) -> None:
+        now = time.perf_counter()
+        if not self.paused and self.__last_frame is not None:
+            self.seek(self.t + (now - self.__last_frame) * self.speed)
+            self.slider.set(self.t)
+        self.__last_frame = now
+        self.root.after(FRAME_INTERVAL_MS, self.__tick)
+
+    def run(self) -> None:
+        self.draw()
+        self.root.after(FRAME_INTERVAL_MS, self.__tick)
+        self.root.mainloop()
+
+
+def _tk_color(color: str) -> str:
+    """
+    salabim color names like "30%gray" as tkinter colors
+    """
+    if color.endswith("gray") and "%" in color:
+        level = round(int(color[: color.index("%")]) * 255 / 100)
+        return f"#{level:02x}{level:02x}{level:02x}"
+    return color
+
+
+if __name__ == "__main__":
+    import sys
+
+    start = time.perf_counter()
+    replay = Replay.load(sys.argv[1])
+    print(
+        f"{len(replay)} rows, t={replay.start_time}..{replay.end_time} "
+        f"indexed in {time.perf_counter() - start:6.2f}s"
+    )
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else REPLAY_SPEED
+    ReplayViewer(replay, speed=speed).run()
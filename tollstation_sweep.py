@@ -0,0 +1,197 @@
+"""
+replications and parameter sweeps of the toll station model
+
+a scenario is a dict of tollstation module constants, e.g.
+{"ROAD_NUM": 4, "ETC_RATIO": 0.5, "ARRIVAL_INTERVAL": 10, "STEP_LENGTH": 1}.
+Replications only differ with a random input, e.g. "EXPONENTIAL_ARRIVALS":
+True or a MANUAL_SERVICE_TIME distribution, the model is deterministic
+otherwise. Scenarios are pickled, so a distribution is given as a spec, e.g.
+"Exponential(20)", or a factory, e.g. functools.partial(sim.Exponential, 20),
+and built by every booth from the random stream of its replication. Every
+replication of every scenario runs headless as one task of a concurrent.futures
+process pool, replication r uses seed base_seed + r in all scenarios. The
+results table has one row per scenario with the mean and the confidence
+interval half width of every measure over the replications
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import csv
+import itertools
+import math
+import statistics
+from typing import Any, Iterable, Sequence
+
+import tollstation as ts
+import tollstation_parallel
+
+sim = ts.sim
+
+MEASURES = ("throughput", "time_in_system", "waiting_time", "vehicles_in_lane")
+
+
+def grid(**values: Sequence[Any]) -> list[dict[str, Any]]:
+    """
+    all combinations of the values, e.g. grid(ROAD_NUM=[2, 4], STEP_LENGTH=[1])
+    """
+    names = list(values)
+    return [
+        dict(zip(names, combination))
+        for combination in itertools.product(*values.values())
+    ]
+
+
+def run_replication(
+    scenario: dict[str, Any], till: float, seed: int
+) -> dict[str, float]:
+    """
+    one headless run of scenario, runs in a worker process
+
+    :return: vehicles passed per time unit, mean time in system, mean waiting
+        time and mean number of vehicles on all lanes
+    """
+    tollstation_parallel.apply_settings(scenario)
+    env = sim.Environment(random_seed=seed)
+    roads = ts.create_roads(seed=seed)
+    env.run(till=till)
+    result = ts.statistics(roads)
+    return {
+        "throughput": result["passed"] / till,
+        "time_in_system": result["time_in_system"],
+        "waiting_time": result["waiting_time"],
+        "vehicles_in_lane": result["vehicles_in_lane"],
+    }
+
+
+def _t_central_probability(t: float, df: int) -> float:
+    """
+    P(|T| < t) for t >= 0 of the Student t distribution with integer df, the
+    finite series of Abramowitz and Stegun 26.7.3 and 26.7.4
+    """
+    theta = math.atan(t / math.sqrt(df))
+    cos2 = math.cos(theta) ** 2
+    if df % 2:
+        term = math.cos(theta)
+        total = 0.0
+        for k in range(1, (df - 1) // 2 + 1):
+            total += term
+            term *= cos2 * 2 * k / (2 * k + 1)
+        return 2 / math.pi * (theta + math.sin(theta) * total)
+    term = 1.0
+    total = 0.0
+    for k in range(df // 2):
+        total += term
+        term *= cos2 * (2 * k + 1) / (2 * k + 2)
+    return math.sin(theta) * total
+
+
+def t_quantile(p: float, df: int) -> float:
+    """
+    quantile of the Student t distribution with integer df, the exact
+    distribution function inverted by bisection
+    """
+    if p < 0.5:
+        return -t_quantile(1 - p, df)
+    target = 2 * p - 1
+    low, high = 0.0, 1.0
+    while _t_central_probability(high, df) < target:
+        low, high = high, 2 * high
+    for _ in range(100):
+        middle = (low + high) / 2
+        if _t_central_probability(middle, df) < target:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def confidence_interval(
+    values: Sequence[float], confidence: float = 0.95
+) -> tuple[float, float]:
+    """
+    :return: mean and half width of the confidence interval of the mean
+    """
+    n = len(values)
+    mean = statistics.fmean(values)
+    if n < 2:
+        return mean, math.nan
+    half_width = (
+        t_quantile((1 + confidence) / 2, n - 1)
+        * statistics.stdev(values)
+        / math.sqrt(n)
+    )
+    return mean, half_width
+
+
+def sweep(
+    scenarios: Iterable[dict[str, Any]],
+    replications: int = 50,
+    till: float = 1000,
+    base_seed: int = 0,
+    workers: int = None,
+    confidence: float = 0.95,
+) -> list[dict[str, Any]]:
+    """
+    run all replications of all scenarios on a pool of workers processes
+    (default the number of cpus)
+
+    :return: one row per scenario, the scenario values followed by
+        <measure> and <measure>_ci (half width) for every measure in MEASURES
+    """
+    scenarios = list(scenarios)
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = [
+            [
+                executor.submit(run_replication, scenario, till, base_seed + r)
+                for r in range(replications)
+            ]
+            for scenario in scenarios
+        ]
+        results = [[future.result() for future in row] for row in futures]
+    table = []
+    for scenario, runs in zip(scenarios, results):
+        row = dict(scenario, replications=len(runs))
+        for measure in MEASURES:
+            row[measure], row[measure + "_ci"] = confidence_interval(
+                [run[measure] for run in runs], confidence
+            )
+        table.append(row)
+    return table
+
+
+def write_csv(table: list[dict[str, Any]], path: str) -> None:
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(table[0]))
+        writer.writeheader()
+        writer.writerows(table)
+
+
+def print_table(table: list[dict[str, Any]]) -> None:
+    columns = list(table[0])
+    cells = [
+        [f"{row[c]:.4g}" if isinstance(row[c], float) else str(row[c]) for c in columns]
+        for row in table
+    ]
+    widths = [
+        max(len(c), *(len(line[i]) for line in cells)) for i, c in enumerate(columns)
+    ]
+    print("  ".join(c.rjust(w) for c, w in zip(columns, widths)))
+    for line in cells:
+        print("  ".join(cell.rjust(w) for cell, w in zip(line, widths)))
+
+
+if __name__ == "__main__":
+    table = sweep(
+        grid(
+            ROAD_NUM=[2, 4],
+            ETC_RATIO=[0.5, 1],
+            ARRIVAL_INTERVAL=[10, 20],
+            STEP_LENGTH=[1, 2],
+            EXPONENTIAL_ARRIVALS=[True],
+        ),
+        replications=5,
+        till=500,
+    )
+    print_table(table)
+    write_csv(table, "sweep.csv")
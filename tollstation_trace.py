@@ -0,0 +1,251 @@
+"""
+trace-driven arrivals: real toll records instead of a constant arrival interval
+
+a record has a timestamp, a lane, a vehicle class and whether the vehicle paid
+by ETC. Records are read in chunks of TRACE_DTYPE structured arrays from
+
++ CSV with a header line timestamp,lane,vehicle_class,etc where timestamp is
+  seconds or an ISO 8601 date time
++ a columnar directory with one raw little-endian file per field
+  (<field>.bin), read through np.memmap, see write_columns()
+
+so multi-day traces never have to fit in memory. TraceDispatcher holds till
+the timestamp of each record and hands it to the TraceVehicleGenerator of its
+lane, which creates the Vehicle as soon as the start of the road is free
+"""
+
+from __future__ import annotations
+
+import collections
+import csv
+import datetime
+import os
+from typing import Iterable, Iterator
+
+import numpy as np
+
+import tollstation as ts
+
+sim = ts.sim
+
+TRACE_DTYPE = np.dtype(
+    [("timestamp", "<f8"), ("lane", "<i4"), ("vehicle_class", "<i2"), ("etc", "?")]
+)
+CHUNK_SIZE = 65536
+
+_TRUE = {"1", "true", "yes", "etc"}
+_FALSE = {"0", "false", "no", "manual"}
+
+
+def _parse_etc(value: str) -> bool:
+    value = value.strip().lower()
+    if value in _TRUE:
+        return True
+    if value in _FALSE:
+        return False
+    raise ValueError(f"not an ETC/manual value: {value!r}")
+
+
+class _TimeParser:
+    """
+    timestamps in seconds, or ISO 8601 date times in seconds since t0 (default
+    the first date time read)
+    """
+
+    def __init__(self, t0: datetime.datetime = None):
+        self.t0 = t0
+
+    def __call__(self, value: str) -> float:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        t = datetime.datetime.fromisoformat(value.strip())
+        if self.t0 is None:
+            self.t0 = t
+        return (t - self.t0).total_seconds()
+
+
+def read_csv(
+    path: str, chunk_size: int = CHUNK_SIZE, t0: datetime.datetime = None
+) -> Iterator[np.ndarray]:
+    """
+    records of a CSV file in chunks of at most chunk_size
+
+    :param t0: time zero of ISO 8601 timestamps, defaults to the first one
+    """
+    parse_time = _TimeParser(t0)
+    with open(path, newline="") as file:
+        reader = csv.DictReader(file)
+        rows = []
+        for row in reader:
+            rows.append(
+                (
+                    parse_time(row["timestamp"]),
+                    int(row["lane"]),
+                    int(row["vehicle_class"]),
+                    _parse_etc(row["etc"]),
+                )
+            )
+            if len(rows) == chunk_size:
+                yield np.array(rows, dtype=TRACE_DTYPE)
+                rows = []
+        if rows:
+            yield np.array(rows, dtype=TRACE_DTYPE)
+
+
+def write_columns(chunks: Iterable[np.ndarray], path: str) -> int:
+    """
+    append the records of chunks to the columnar trace directory path
+
+    :return: number of records written
+    """
+    os.makedirs(path, exist_ok=True)
+    files = {
+        name: open(os.path.join(path, f"{name}.bin"), "ab")
+        for name in TRACE_DTYPE.names
+    }
+    n = 0
+    try:
+        for chunk in chunks:
+            for name, file in files.items():
+                file.write(np.ascontiguousarray(chunk[name]).tobytes())
+            n += len(chunk)
+    finally:
+        for file in files.values():
+            file.close()
+    return n
+
+
+def read_columns(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """
+    records of a columnar trace directory in chunks of at most chunk_size
+    """
+    columns = {
+        name: np.memmap(
+            os.path.join(path, f"{name}.bin"),
+            dtype=TRACE_DTYPE.fields[name][0],
+            mode="r",
+        )
+        for name in TRACE_DTYPE.names
+    }
+    n = len(columns["timestamp"])
+    if any(len(column) != n for column in columns.values()):
+        raise ValueError(f"columns of {path} have different lengths")
+    for start in range(0, n, chunk_size):
+        chunk = np.empty(min(chunk_size, n - start), dtype=TRACE_DTYPE)
+        for name, column in columns.items():
+            chunk[name] = column[start : start + len(chunk)]
+        yield chunk
+
+
+def read_trace(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """
+    read_columns() for a directory, read_csv() otherwise
+    """
+    if os.path.isdir(path):
+        return read_columns(path, chunk_size)
+    return read_csv(path, chunk_size)
+
+
+class TraceVehicleGenerator(ts.VehicleGenerator):
+    """
+    creates the vehicles of the records handed over by TraceDispatcher (or
+    tollstation_plaza.Plaza) in arrival order, vehicles that find the start
+    of the road occupied queue up outside the road
+    """
+
+    def setup(self, *args, **kwargs):
+        super().setup(*args, **kwargs)
+        self.backlog = collections.deque()
+        # 连续运动的车辆驶离起点时产生事件,移动claim时唤醒等待的生成器
+        self.claim_set.zones.append(self.claim)
+
+    def process(self):
+        while True:
+            while not self.backlog:
+                self.passivate()
+            self.__wait_for_space()
+            vehicle_class, etc = self.backlog.popleft()
+            v = sim.Uniform(
+                self.SLOWEST_V, self.FASTEST_V, randomstream=self.random_stream
+            )()
+            ts.Vehicle.arrive(
+                velocity=v,
+                x_pos=self.x,
+                claim_set=self.claim_set,
+                vehicle_color=self.cstr,
+                vehicle_class=vehicle_class,
+                etc=etc,
+            )
+            # 让新车先占用起点,再判断下一辆车能否进入
+            self.hold(0)
+
+    def __wait_for_space(self) -> None:
+        while self.claim.overlaps():
+            last = self.claim_set.last_vehicle
+            if last is not None and last.has_passed(self.claim):
+                return
+            self.claim.wait()
+
+
+class TraceDispatcher(sim.Component):
+    """
+    replays chunks of records in time order, records of lanes without a road
+    are counted in skipped
+    """
+
+    def setup(
+        self,
+        chunks: Iterable[np.ndarray],
+        generators: dict[int, TraceVehicleGenerator],
+    ):
+        self.chunks = chunks
+        self.generators = generators
+        self.dispatched = 0
+        self.skipped = 0
+
+    def process(self):
+        for chunk in self.chunks:
+            for timestamp, lane, vehicle_class, etc in chunk.tolist():
+                if timestamp < self.env.now():
+                    raise ValueError(f"trace not sorted on timestamp at {timestamp}")
+                self.hold(till=timestamp)
+                generator = self.generators.get(lane)
+                if generator is None:
+                    self.skipped += 1
+                    continue
+                generator.backlog.append((vehicle_class, etc))
+                if generator.ispassive():
+                    generator.activate()
+                self.dispatched += 1
+
+
+def create_trace_roads(
+    chunks: Iterable[np.ndarray], road_num: int = None, seed: int = None
+) -> tuple[list[ts.Road], TraceDispatcher]:
+    """
+    create_roads() whose vehicles arrive as given by the records of chunks,
+    e.g. create_trace_roads(read_trace("toll.csv"))
+    """
+    roads = ts.create_roads(
+        road_num, seed=seed, vehicle_generator_class=TraceVehicleGenerator
+    )
+    dispatcher = TraceDispatcher(
+        chunks=chunks,
+        generators={i: road.vehicle_generator for i, road in enumerate(roads)},
+    )
+    return roads, dispatcher
+
+
+if __name__ == "__main__":
+    import sys
+
+    ts.set_headless()
+    env = sim.Environment()
+    roads, dispatcher = create_trace_roads(read_trace(sys.argv[1]))
+    env.run(till=float(sys.argv[2]) if len(sys.argv) > 2 else None)
+    print(
+        f"dispatched {dispatcher.dispatched} skipped {dispatcher.skipped}",
+        ts.statistics(roads),
+    )